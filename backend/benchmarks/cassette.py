@@ -0,0 +1,224 @@
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Iterator, Optional
+from unittest import mock
+import asyncio
+import hashlib
+import json
+import threading
+import time
+
+import arxiv
+import httpx
+
+from utils.http_client import HttpClient
+from utils.local_llm import AsyncLocalAnthropic, LocalAnthropic
+
+"""
+Record/replay of everything the search pipelines fetch over the network:
+
+    arxiv       arxiv.Client.results
+    http        patent pages and FPO listings, via the shared HttpClient
+    llm         client.messages.create on the controllers' shared Anthropic clients
+
+recording() runs the pipelines live and stores each response in a Cassette, keyed by
+a hash of its request. replaying() serves the same responses back with a configurable
+injected latency per kind, so runs are reproducible and need no network. Requests that
+are repeated with different answers (sampled LLM calls) are replayed in recorded order.
+
+Selenium fallbacks can't be replayed and are disabled in both modes.
+"""
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+def _key(request: Any) -> str:
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    kinds = ("arxiv", "http", "llm")
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.cases: dict[str, list[str]] = {}
+        self.interactions: dict[str, dict[str, list[Any]]] = {kind: {} for kind in self.kinds}
+        self._cursors: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str | Path) -> "Cassette":
+        cassette = cls(path)
+        with open(path) as f:
+            data = json.load(f)
+        cassette.cases = data["cases"]
+        cassette.interactions.update(data["interactions"])
+        return cassette
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({"cases": self.cases, "interactions": self.interactions}, f)
+
+    def record(self, kind: str, request: Any, response: Any) -> None:
+        with self._lock:
+            self.interactions[kind].setdefault(_key(request), []).append(response)
+
+    def play(self, kind: str, request: Any) -> Any:
+        key = _key(request)
+        with self._lock:
+            responses = self.interactions[kind].get(key)
+            if not responses:
+                raise CassetteMiss(f"No recorded {kind} response for {json.dumps(request, default=str)[:200]}")
+            cursor = self._cursors.get((kind, key), 0)
+            self._cursors[(kind, key)] = cursor + 1
+            return responses[cursor % len(responses)]
+
+    def rewind(self) -> None:
+        with self._lock:
+            self._cursors.clear()
+
+
+@dataclass
+class InjectedLatency:
+    """Seconds added to every replayed response of each kind."""
+    llm: float = 0.0
+    http: float = 0.0
+    arxiv: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "InjectedLatency":
+        """From e.g. "llm=1.2,http=0.3,arxiv=1.5"."""
+        latency = cls()
+        for part in filter(None, spec.split(",")):
+            kind, seconds = part.split("=")
+            setattr(latency, kind.strip(), float(seconds))
+        return latency
+
+
+def _arxiv_request(search: arxiv.Search) -> dict[str, Any]:
+    return {"query": search.query, "max_results": search.max_results,
+            "sort_by": str(search.sort_by), "sort_order": str(search.sort_order)}
+
+
+def _arxiv_result(result: arxiv.Result) -> dict[str, Any]:
+    return {
+        "entry_id": result.entry_id,
+        "title": result.title,
+        "authors": [author.name for author in result.authors],
+        "summary": result.summary,
+        "pdf_url": result.pdf_url,
+        "published": result.published.isoformat(),
+        "doi": result.doi,
+    }
+
+
+def _replayed_arxiv_result(result: dict[str, Any]) -> SimpleNamespace:
+    return SimpleNamespace(**{
+        **result,
+        "authors": [SimpleNamespace(name=name) for name in result["authors"]],
+        "published": datetime.fromisoformat(result["published"]),
+    })
+
+
+def _http_request(method: str, url: str, kwargs: dict[str, Any]) -> dict[str, Any]:
+    return {"method": method, "url": url, "params": kwargs.get("params")}
+
+
+def _llm_request(kwargs: dict[str, Any]) -> dict[str, Any]:
+    return {name: kwargs.get(name) for name in ("model", "system", "messages", "max_tokens", "temperature")}
+
+
+class _RecordingMessages:
+    def __init__(self, messages, cassette: Cassette):
+        self._messages = messages
+        self._cassette = cassette
+
+    def create(self, **kwargs):
+        message = self._messages.create(**kwargs)
+        self._cassette.record("llm", _llm_request(kwargs), message.model_dump(mode="json"))
+        return message
+
+
+class _AsyncRecordingMessages(_RecordingMessages):
+    async def create(self, **kwargs):
+        message = await self._messages.create(**kwargs)
+        self._cassette.record("llm", _llm_request(kwargs), message.model_dump(mode="json"))
+        return message
+
+
+def _recording_client(client, cassette: Cassette, is_async: bool):
+    messages = (_AsyncRecordingMessages if is_async else _RecordingMessages)(client.messages, cassette)
+    return SimpleNamespace(messages=messages)
+
+
+def _no_selenium(engine, query: str) -> list[str]:
+    return []
+
+
+@contextmanager
+def recording(cassette: Cassette) -> Iterator[Cassette]:
+    from controllers import arxiv_controller, patent_controller
+
+    original_results = arxiv.Client.results
+    original_request = HttpClient._request
+    async_client = _recording_client(arxiv_controller.get_async_client(), cassette, is_async=True)
+    client = _recording_client(patent_controller.get_client(), cassette, is_async=False)
+
+    def results(client, search, offset=0):
+        fetched = list(original_results(client, search, offset))
+        cassette.record("arxiv", _arxiv_request(search), [_arxiv_result(result) for result in fetched])
+        return iter(fetched)
+
+    async def request(http_client, method, url, **kwargs):
+        resp = await original_request(http_client, method, url, **kwargs)
+        # The body is stored decoded, so drop the headers that describe its encoding
+        headers = {name: value for name, value in resp.headers.items()
+                   if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")}
+        cassette.record("http", _http_request(method, url, kwargs),
+                        {"status_code": resp.status_code, "headers": headers, "text": resp.text})
+        return resp
+
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(arxiv.Client, "results", results))
+        stack.enter_context(mock.patch.object(HttpClient, "_request", request))
+        stack.enter_context(mock.patch.object(arxiv_controller, "get_async_client", lambda: async_client))
+        stack.enter_context(mock.patch.object(patent_controller, "get_client", lambda: client))
+        stack.enter_context(mock.patch.object(patent_controller.GPatentEngine, "_patent_fpo_selenium_search", _no_selenium))
+        yield cassette
+
+
+@contextmanager
+def replaying(cassette: Cassette, latency: Optional[InjectedLatency] = None) -> Iterator[Cassette]:
+    from controllers import arxiv_controller, patent_controller
+
+    latency = latency or InjectedLatency()
+
+    def results(client, search, offset=0):
+        time.sleep(latency.arxiv)
+        return iter([_replayed_arxiv_result(result) for result in cassette.play("arxiv", _arxiv_request(search))])
+
+    async def request(http_client, method, url, **kwargs):
+        await asyncio.sleep(latency.http)
+        recorded = cassette.play("http", _http_request(method, url, kwargs))
+        return httpx.Response(recorded["status_code"], headers=recorded["headers"], text=recorded["text"],
+                              request=httpx.Request(method, url, params=kwargs.get("params")))
+
+    def responder(request: dict[str, Any]) -> str:
+        return cassette.play("llm", _llm_request(request))["content"][0]["text"]
+
+    async_client = AsyncLocalAnthropic(responder, latency=latency.llm)
+    client = LocalAnthropic(responder, latency=latency.llm)
+
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(arxiv.Client, "results", results))
+        stack.enter_context(mock.patch.object(HttpClient, "_request", request))
+        stack.enter_context(mock.patch.object(arxiv_controller, "get_async_client", lambda: async_client))
+        stack.enter_context(mock.patch.object(patent_controller, "get_client", lambda: client))
+        stack.enter_context(mock.patch.object(patent_controller.GPatentEngine, "_patent_fpo_selenium_search", _no_selenium))
+        yield cassette
@@ -0,0 +1,214 @@
+from pathlib import Path
+from statistics import median
+from typing import Any, Optional
+from unittest import mock
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+# ANTHROPIC_API_KEY for recording, from the backend's .env
+load_dotenv()
+
+# Every run must do the same work: no on-disk LLM responses, no previously stored
+# patents, and no local indexes that may differ between machines
+os.environ["LLM_CACHE_BYPASS"] = "true"
+os.environ["SEMANTIC_SEARCH"] = "off"
+os.environ["ARXIV_SEARCH_BACKEND"] = "api"
+os.environ["FPO_SEARCH_BACKEND"] = "http"
+# Timings are collected by the benchmark itself, skip the per-span log lines
+os.environ["TRACE_SPANS"] = "false"
+
+from benchmarks.cassette import Cassette, InjectedLatency, recording, replaying
+from utils.llm import track_usage
+from utils.patent_store import PatentStore
+from utils.timing import track_timings
+
+"""
+Offline benchmark of the two search pipelines (search_by_description and
+GPatentEngine.search) against recorded network traffic.
+
+Record a cassette once, with network access and ANTHROPIC_API_KEY:
+    python -m benchmarks.run record --cases 3
+
+Then replay it as often as needed, anywhere:
+    python -m benchmarks.run replay --latency llm=1.5,http=0.3,arxiv=2 --repeat 3
+    python -m benchmarks.run replay --save-baseline      # after a known-good change
+    python -m benchmarks.run replay --baseline benchmarks/baseline.json
+
+The report has the end-to-end latency, the wall time of each pipeline stage (see
+utils/timing.py) and the LLM calls per search, averaged over the cases and the median
+over repeats. Replays against a baseline exit non-zero when a metric regressed by more
+than --tolerance.
+"""
+
+benchmarks_dir = Path(__file__).resolve().parent
+datasets_dir = benchmarks_dir.parent.parent / "eval" / "datasets"
+default_cassette = benchmarks_dir / "cassettes" / "default.json"
+default_baseline = benchmarks_dir / "baseline.json"
+
+pipelines = ("arxiv", "patent")
+
+
+def load_cases(count: int) -> dict[str, list[str]]:
+    """The first count inputs of the arXiv and patent eval datasets."""
+    cases = {}
+    for pipeline in pipelines:
+        with open(datasets_dir / f"{pipeline}_evals.csv", newline="") as f:
+            cases[pipeline] = [row["input"] for row in csv.DictReader(f)][:count]
+    return cases
+
+
+async def run_pipeline(pipeline: str, description: str) -> None:
+    from controllers.arxiv_controller import search_by_description
+    from controllers.patent_controller import GPatentEngine
+
+    if pipeline == "arxiv":
+        await search_by_description(description)
+        return
+
+    def search():
+        engine = GPatentEngine()
+        try:
+            engine.search(description)
+        finally:
+            engine.close()
+
+    await asyncio.to_thread(search)
+
+
+async def measure(pipeline: str, description: str) -> dict[str, Any]:
+    # A fresh store per search, so every run fetches and summarizes the same patents
+    with tempfile.TemporaryDirectory() as store_dir, \
+            mock.patch("controllers.patent_controller.get_patent_store",
+                       lambda: PatentStore(Path(store_dir) / "patents.sqlite3")), \
+            track_timings() as timings, track_usage() as usage:
+        start = time.perf_counter()
+        await run_pipeline(pipeline, description)
+        latency = time.perf_counter() - start
+
+    return {
+        "latency_seconds": latency,
+        "stages": {name: stats["wall_seconds"] for name, stats in timings.to_dict().items()},
+        "llm_requests": usage.requests,
+    }
+
+
+def _mean(values: list[float]) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+def summarize(measurements: list[dict[str, Any]]) -> dict[str, Any]:
+    stage_names = sorted({name for m in measurements for name in m["stages"]})
+    return {
+        "latency_seconds": _mean([m["latency_seconds"] for m in measurements]),
+        "stages": {name: _mean([m["stages"].get(name, 0.0) for m in measurements]) for name in stage_names},
+        "llm_requests": _mean([m["llm_requests"] for m in measurements]),
+    }
+
+
+def median_of(reports: list[dict[str, Any]]) -> dict[str, Any]:
+    stage_names = sorted({name for report in reports for name in report["stages"]})
+    return {
+        "latency_seconds": median(report["latency_seconds"] for report in reports),
+        "stages": {name: median(report["stages"].get(name, 0.0) for report in reports) for name in stage_names},
+        "llm_requests": median(report["llm_requests"] for report in reports),
+    }
+
+
+async def run_cases(cases: dict[str, list[str]]) -> dict[str, Any]:
+    report = {}
+    for pipeline in pipelines:
+        report[pipeline] = summarize([await measure(pipeline, description) for description in cases[pipeline]])
+    return report
+
+
+def flatten(report: dict[str, Any]) -> dict[str, float]:
+    metrics = {}
+    for pipeline, summary in report.items():
+        metrics[f"{pipeline}.latency_seconds"] = summary["latency_seconds"]
+        metrics[f"{pipeline}.llm_requests"] = summary["llm_requests"]
+        for name, seconds in summary["stages"].items():
+            metrics[f"{pipeline}.{name}"] = seconds
+    return metrics
+
+
+def print_report(report: dict[str, Any], baseline: Optional[dict[str, Any]], tolerance: float) -> list[str]:
+    """Print each metric (with its change from the baseline) and return the regressed ones."""
+    metrics = flatten(report)
+    baseline_metrics = flatten(baseline) if baseline else {}
+    regressions = []
+    for name, value in metrics.items():
+        line = f"{name:<32} {value:10.3f}"
+        previous = baseline_metrics.get(name)
+        if previous is not None:
+            change = (value - previous) / previous if previous else 0.0
+            line += f"  {change:+7.1%} vs {previous:.3f}"
+            # Ignore sub-10ms noise on stages that barely take any time
+            if change > tolerance and value - previous > 0.01:
+                regressions.append(name)
+                line += "  REGRESSED"
+        print(line)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record/replay benchmark of the search pipelines")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    record_parser = subcommands.add_parser("record", help="Run the pipelines live and record a cassette")
+    record_parser.add_argument("--cases", type=int, default=3, help="inputs per pipeline from the eval datasets")
+    record_parser.add_argument("--cassette", default=default_cassette)
+    replay_parser = subcommands.add_parser("replay", help="Benchmark the pipelines against a recorded cassette")
+    replay_parser.add_argument("--cassette", default=default_cassette)
+    replay_parser.add_argument("--latency", default="", type=InjectedLatency.parse,
+                               help='injected seconds per response, e.g. "llm=1.5,http=0.3,arxiv=2"')
+    replay_parser.add_argument("--repeat", type=int, default=1)
+    replay_parser.add_argument("--baseline", help="compare against this stored report")
+    replay_parser.add_argument("--save-baseline", nargs="?", const=default_baseline,
+                               help=f"store this report as the baseline (default {default_baseline})")
+    replay_parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown before failing")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        cassette = Cassette(args.cassette)
+        cassette.cases = load_cases(args.cases)
+        with recording(cassette):
+            report = asyncio.run(run_cases(cassette.cases))
+        cassette.save()
+        print(f"Recorded {sum(len(v) for v in cassette.interactions.values())} interactions to {cassette.path}")
+        print_report(report, None, args.tolerance)
+        sys.exit(0)
+
+    # Replayed responses come from the local stand-in, so the provider's rate limits don't
+    # apply; with them the report would measure the limiter rather than the pipelines. Set
+    # before the first LLM call creates the process-wide limiter.
+    os.environ["ANTHROPIC_RPM"] = os.environ["ANTHROPIC_TPM"] = "1e12"
+    os.environ["LLM_MAX_CONCURRENCY"] = "1000000"
+
+    cassette = Cassette.load(args.cassette)
+    reports = []
+    with replaying(cassette, args.latency):
+        for _ in range(args.repeat):
+            cassette.rewind()
+            reports.append(asyncio.run(run_cases(cassette.cases)))
+    report = {pipeline: median_of([r[pipeline] for r in reports]) for pipeline in pipelines}
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = print_report(report, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+    if regressions:
+        print(f"{len(regressions)} metrics regressed by more than {args.tolerance:.0%}")
+        sys.exit(1)
@@ -0,0 +1,59 @@
+from pathlib import Path
+from statistics import median
+import argparse
+import json
+import subprocess
+import sys
+
+"""
+Cold start benchmark of the API server: how long a fresh process takes to import
+main and run the FastAPI lifespan startup, i.e. what every `uvicorn --reload` restart
+and new worker pays before it can serve /api/search.
+
+    python -m benchmarks.startup --repeat 10
+
+Each run is a new interpreter, so nothing is shared between runs except the OS file
+cache. The report also lists which heavy optional dependencies got imported.
+"""
+
+backend_dir = Path(__file__).resolve().parent.parent
+
+heavy_modules = ("anthropic", "arxiv", "bs4", "numpy", "selenium")
+
+# Runs in the child process; prints one JSON line
+_measure = f"""
+import asyncio, json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def startup():
+    async with main.app.router.lifespan_context(main.app):
+        ready = time.perf_counter()
+        loaded = [name for name in {heavy_modules!r} if name in sys.modules]
+    return ready, loaded
+
+ready, loaded = asyncio.run(startup())
+print(json.dumps({{"import_seconds": imported - start, "startup_seconds": ready - imported, "modules": loaded}}))
+"""
+
+
+def measure_once() -> dict:
+    result = subprocess.run([sys.executable, "-c", _measure], cwd=backend_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"Startup failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start time of the API server")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.repeat)]
+    import_seconds = median(run["import_seconds"] for run in runs)
+    startup_seconds = median(run["startup_seconds"] for run in runs)
+    print(f"import main        {import_seconds * 1000:8.1f} ms")
+    print(f"lifespan startup   {startup_seconds * 1000:8.1f} ms")
+    print(f"total              {(import_seconds + startup_seconds) * 1000:8.1f} ms  (median of {args.repeat})")
+    print(f"heavy modules loaded: {', '.join(runs[-1]['modules']) or 'none'}")
@@ -1,23 +1,34 @@
 import arxiv
-from typing import List, Optional, Set, Dict, Union
-from dataclasses import dataclass
+from typing import Any, AsyncIterator, List, Optional, Set, Dict, Union
+from dataclasses import dataclass, asdict
 import json
-from anthropic import Anthropic
-from dotenv import load_dotenv
 import textwrap
 import asyncio
+import os
+from utils.llm import acreate_message, cached_system, get_async_client, prompt_caching_enabled
+from utils.models import cascade_enabled, fast_model, min_cacheable_tokens, query_max_tokens, reasoned_score_max_tokens, score_max_tokens, select_for_rescoring, strong_model
+from utils.rate_limiter import estimate_tokens
+from utils.timing import stage
+from utils.arxiv_index import arxiv_index_path, get_arxiv_index
+from utils.prerank import prerank
+from utils.vector_index import get_vector_index, reciprocal_rank_fusion, semantic_search_mode
 
-load_dotenv()
+# Max number of papers scored concurrently per search
+scoring_concurrency = int(os.environ.get("ARXIV_SCORING_CONCURRENCY", 10))
 
-anthropic = Anthropic()
+# Number of papers scored per LLM request (1 disables batching)
+scoring_batch_size = int(os.environ.get("ARXIV_SCORING_BATCH_SIZE", 5))
 
-"""
-claude-3-7-sonnet-20250219
-claude-3-5-sonnet-20240620
-claude-3-opus-20240229
-claude-3-5-haiku-20241022 --> cheapest
-"""
-claude_model="claude-3-7-sonnet-20250219"
+# Number of arxiv results retrieved per search; only the max_papers best by local
+# pre-ranking are sent to the LLM for scoring
+retrieval_size = int(os.environ.get("ARXIV_RETRIEVAL_SIZE", 100))
+
+# "api" queries arxiv.org (falling back to the local index if it fails), "local" only
+# queries the local snapshot index, see utils/arxiv_index.py
+search_backend = os.environ.get("ARXIV_SEARCH_BACKEND", "api")
+
+# Model choices and the scoring cascade are configured in utils/models.py
+claude_model = strong_model
 
 @dataclass
 class ArxivPaper:
@@ -32,25 +43,8 @@ class ArxivPaper:
     relevance_score: float = 0.0
     reasoning: str = ""
 
-"""
-TODO:
-1. We have a pdf url, if we could analyze that in some fashion, that would be ideal. note: needs to be https and has file size limits.
-"""
-async def evaluate_arxiv_paper(paper: ArxivPaper, description: str, semaphore: asyncio.Semaphore) -> Dict[str, Union[float, str]]:
-    async with semaphore:
-        prompt = f"""
-You are evaluating the relevance of a research paper to a patent/invention description.
-Analyze how relevant and similar the paper's concepts are to the invention.
-A score of 1 means that the description will infringe upon the given paper.
-
-Invention Description:
-{description}
-
-Paper Details:
-Title: {paper.title}
-Summary: {paper.summary}
-
-Output a single float number between 0 and 1 representing the relevance score.
+_criteria = """
+Output a float number between 0 and 1 representing the relevance score.
 0 means completely irrelevant, 1 means the invention would infringe on this paper.
 Consider:
 - Conceptual similarity
@@ -58,7 +52,13 @@ Consider:
 - Potential applicability
 - Implementation methods
 - Specific claims and techniques described
+"""
 
+single_paper_instructions = f"""
+You are evaluating the relevance of a research paper to a patent/invention description.
+Analyze how relevant and similar the paper's concepts are to the invention.
+A score of 1 means that the description will infringe upon the given paper.
+{_criteria}
 Respond with a JSON object containing two fields:
 1. relevance_score: A number between 0 and 1
 2. reasoning: A string explaining the score
@@ -68,20 +68,83 @@ Example format:
 
 Return only valid minified JSON with no Markdown formatting, no code fences,
 no explanation text—just the JSON object.
+"""
+
+batch_instructions = f"""
+You are evaluating the relevance of several research papers to a patent/invention description.
+For each paper, analyze how relevant and similar the paper's concepts are to the invention.
+A score of 1 means that the description will infringe upon the given paper.
+{_criteria}
+Respond with a JSON array containing one object per paper, each with three fields:
+1. paper_id: The Paper ID exactly as given
+2. relevance_score: A number between 0 and 1
+3. reasoning: A string explaining the score
+
+Example format:
+[{{"paper_id": "2403.12345v1", "relevance_score": 0.75, "reasoning": "This paper is highly relevant because..."}}]
+
+Return only valid minified JSON with no Markdown formatting, no code fences,
+no explanation text—just the JSON array.
+"""
+
+# Bare-score variants for the cascade's fast pass, whose reasoning would be replaced by
+# the re-score anyway for the papers that matter
+fast_single_paper_instructions = f"""
+You are evaluating the relevance of a research paper to a patent/invention description.
+Analyze how relevant and similar the paper's concepts are to the invention.
+A score of 1 means that the description will infringe upon the given paper.
+{_criteria}
+Respond with only the relevance score, e.g. 0.75, and nothing else.
+"""
+
+fast_batch_instructions = f"""
+You are evaluating the relevance of several research papers to a patent/invention description.
+For each paper, analyze how relevant and similar the paper's concepts are to the invention.
+A score of 1 means that the description will infringe upon the given paper.
+{_criteria}
+Respond with a JSON object mapping each Paper ID exactly as given to its relevance score.
+
+Example format:
+{{"2403.12345v1": 0.75, "2401.54321v2": 0.1}}
+
+Return only valid minified JSON with no Markdown formatting, no code fences,
+no explanation text—just the JSON object.
+"""
+
+def scoring_system(instructions: str, description: str) -> List[Dict[str, Any]]:
+    # Identical for every paper of a search, so it is served from the prompt cache after the first call
+    return cached_system(instructions, f"Invention Description:\n{description}")
+
+"""
+TODO:
+1. We have a pdf url, if we could analyze that in some fashion, that would be ideal. note: needs to be https and has file size limits.
+"""
+async def evaluate_arxiv_paper(paper: ArxivPaper, description: str, semaphore: asyncio.Semaphore, model: str = claude_model, reasoned: bool = True) -> Dict[str, Union[float, str]]:
+    """Score one paper; without reasoned, as a bare score with empty reasoning."""
+    async with semaphore:
+        prompt = f"""
+Paper Details:
+Title: {paper.title}
+Summary: {paper.summary}
 """
         try:
-            message = anthropic.messages.create(
-                model=claude_model,
-                max_tokens=2000,
-                temperature=0,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
+            with stage("score"):
+                message = await acreate_message(
+                    get_async_client(),
+                    model=model,
+                    max_tokens=reasoned_score_max_tokens if reasoned else score_max_tokens,
+                    temperature=0,
+                    system=scoring_system(single_paper_instructions if reasoned else fast_single_paper_instructions, description),
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ]
+                )
             
+            if not reasoned:
+                return {"relevance_score": max(0.0, min(1.0, float(message.content[0].text.strip()))), "reasoning": ""}
             result = json.loads(message.content[0].text)
             result["relevance_score"] = max(0.0, min(1.0, float(result["relevance_score"])))
             return result
@@ -89,26 +152,160 @@ no explanation text—just the JSON object.
             print(f"Error evaluating paper: {e}")
             return {"relevance_score": 0.0, "reasoning": f"Failed to evaluate paper: {str(e)}"}
 
-async def score_and_sort_papers(papers: List[ArxivPaper], description: str) -> List[ArxivPaper]:
-    # Create a semaphore limiting to 10 concurrent API calls
-    semaphore = asyncio.Semaphore(10)
-    
-    # Create evaluation tasks for all papers
-    tasks = [
-        evaluate_arxiv_paper(paper, description, semaphore)
+def parse_batch_scores(raw: str, papers: List[ArxivPaper], reasoned: bool = True) -> Dict[str, Dict[str, Union[float, str]]]:
+    """
+    Parse a batched scoring response into {paper_id: result}: a list of reasoned entries,
+    or without reasoned a {paper_id: score} object.
+    Entries that are malformed or refer to unknown papers are dropped, so the caller can
+    tell which papers still need to be scored individually.
+    """
+    try:
+        entries = json.loads(raw)
+    except json.JSONDecodeError:
+        return {}
+    expected_ids = {paper.paper_id for paper in papers}
+    results = {}
+    if not reasoned:
+        if not isinstance(entries, dict):
+            return {}
+        for paper_id, score in entries.items():
+            if paper_id not in expected_ids:
+                continue
+            try:
+                results[paper_id] = {"relevance_score": max(0.0, min(1.0, float(score))), "reasoning": ""}
+            except (TypeError, ValueError):
+                continue
+        return results
+    if not isinstance(entries, list):
+        return {}
+
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        paper_id = entry.get("paper_id")
+        if paper_id not in expected_ids or paper_id in results:
+            continue
+        try:
+            score = max(0.0, min(1.0, float(entry["relevance_score"])))
+        except (KeyError, TypeError, ValueError):
+            continue
+        reasoning = entry.get("reasoning")
+        if not isinstance(reasoning, str):
+            continue
+        results[paper_id] = {"relevance_score": score, "reasoning": reasoning}
+    return results
+
+async def evaluate_arxiv_paper_batch(papers: List[ArxivPaper], description: str, semaphore: asyncio.Semaphore, model: str = claude_model, reasoned: bool = True) -> List[Dict[str, Union[float, str]]]:
+    """
+    Score several papers with a single LLM call. Any paper missing from (or malformed in)
+    the response falls back to evaluate_arxiv_paper.
+    """
+    paper_details = "\n\n".join(
+        f"Paper ID: {paper.paper_id}\nTitle: {paper.title}\nSummary: {paper.summary}"
         for paper in papers
-    ]
-    
-    results = await asyncio.gather(*tasks)
-    
-    for paper, result in zip(papers, results):
-        paper.relevance_score = result["relevance_score"]
-        paper.reasoning = result["reasoning"]
-    
+    )
+    async with semaphore:
+        prompt = f"""
+Papers:
+{paper_details}
+"""
+        try:
+            with stage("score"):
+                message = await acreate_message(
+                    get_async_client(),
+                    model=model,
+                    max_tokens=(reasoned_score_max_tokens if reasoned else score_max_tokens) * len(papers),
+                    temperature=0,
+                    system=scoring_system(batch_instructions if reasoned else fast_batch_instructions, description),
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ]
+                )
+            scored = parse_batch_scores(message.content[0].text, papers, reasoned)
+        except Exception as e:
+            print(f"Error evaluating paper batch: {e}")
+            scored = {}
+
+    missing = [paper for paper in papers if paper.paper_id not in scored]
+    if missing:
+        print(f"Falling back to single-paper scoring for {len(missing)} of {len(papers)} papers")
+        fallback = await asyncio.gather(*[
+            evaluate_arxiv_paper(paper, description, semaphore, model, reasoned) for paper in missing
+        ])
+        scored.update({paper.paper_id: result for paper, result in zip(missing, fallback)})
+
+    return [scored[paper.paper_id] for paper in papers]
+
+async def iter_scored_papers(papers: List[ArxivPaper], description: str, batch_size: int = scoring_batch_size, model: str = claude_model, reasoned: bool = True) -> AsyncIterator[ArxivPaper]:
+    """
+    Score papers concurrently, yielding each one as soon as its score is in. Without
+    reasoned, papers get a bare score and empty reasoning.
+    """
+    # Create a semaphore limiting the number of concurrent API calls
+    semaphore = asyncio.Semaphore(scoring_concurrency)
+
+    async def score_batch(batch: List[ArxivPaper]) -> List[ArxivPaper]:
+        if len(batch) > 1:
+            results = await evaluate_arxiv_paper_batch(batch, description, semaphore, model, reasoned)
+        else:
+            results = [await evaluate_arxiv_paper(batch[0], description, semaphore, model, reasoned)]
+        for paper, result in zip(batch, results):
+            paper.relevance_score = result["relevance_score"]
+            paper.reasoning = result["reasoning"]
+        return batch
+
+    # Score papers in chunks of batch_size, one request per chunk
+    batch_size = max(1, batch_size)
+    batches = [papers[i:i + batch_size] for i in range(0, len(papers), batch_size)]
+
+    # The provider only caches a prefix once a request has written it, so when the
+    # shared prefix is long enough to be cached, score one batch first to write it
+    # and let the rest read it
+    if reasoned:
+        instructions = batch_instructions if batch_size > 1 else single_paper_instructions
+    else:
+        instructions = fast_batch_instructions if batch_size > 1 else fast_single_paper_instructions
+    if len(batches) > 1 and prompt_caching_enabled and \
+            estimate_tokens(instructions + description) >= min_cacheable_tokens(model):
+        for paper in await score_batch(batches.pop(0)):
+            yield paper
+
+    for finished in asyncio.as_completed([score_batch(batch) for batch in batches]):
+        for paper in await finished:
+            yield paper
+
+async def iter_cascade_scored_papers(papers: List[ArxivPaper], description: str, batch_size: int = scoring_batch_size) -> AsyncIterator[ArxivPaper]:
+    """
+    Give every paper a bare score with the fast model, then re-score the few top and
+    borderline ones with the strong model, with reasoning. Re-scored papers are yielded
+    a second time with their final score.
+    """
+    if not cascade_enabled:
+        async for paper in iter_scored_papers(papers, description, batch_size, strong_model):
+            yield paper
+        return
+
+    async for paper in iter_scored_papers(papers, description, batch_size, fast_model, reasoned=False):
+        yield paper
+
+    # Select and batch in input order, not completion order, so ties are broken the same
+    # way and the same search always sends the same prompts
+    rescore = [papers[i] for i in sorted(select_for_rescoring([paper.relevance_score for paper in papers]))]
+    async for paper in iter_scored_papers(rescore, description, batch_size, strong_model):
+        yield paper
+
+def rank_papers(papers: List[ArxivPaper]) -> List[ArxivPaper]:
     # Filter out papers with relevance score of 0 and sort the rest
     relevant_papers = [p for p in papers if p.relevance_score > 0]
     return sorted(relevant_papers, key=lambda x: x.relevance_score, reverse=True)
 
+async def score_and_sort_papers(papers: List[ArxivPaper], description: str, batch_size: int = scoring_batch_size) -> List[ArxivPaper]:
+    scored = {paper.paper_id: paper async for paper in iter_cascade_scored_papers(papers, description, batch_size)}
+    return rank_papers(list(scored.values()))
+
 async def get_search_query(description: str) -> str:
     prompt = f"""
 You are an expert patent analyst.
@@ -138,17 +335,21 @@ Patent-claim description
 {description}
 """
 
-    message = anthropic.messages.create(
-        model=claude_model,
-        max_tokens=2000,
-        temperature=0.2,
-        messages=[
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
-    )
+    # Same description always yields the same query, so reuse it on retries
+    with stage("query"):
+        message = await acreate_message(
+            get_async_client(),
+            cache=True,
+            model=claude_model,
+            max_tokens=query_max_tokens,
+            temperature=0.2,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        )
     
     return message.content[0].text.strip()
 
@@ -156,7 +357,7 @@ def extract_arxiv_id(entry_id: str) -> str:
     # entry_id format: http://arxiv.org/abs/2403.12345v1
     return entry_id.split('/')[-1]
 
-def search_papers(query: str, max_results: int = 25) -> List[ArxivPaper]:
+def search_api_papers(query: str, max_results: int = 25) -> List[ArxivPaper]:
     client = arxiv.Client()
     search = arxiv.Search(
         query=query,
@@ -181,18 +382,111 @@ def search_papers(query: str, max_results: int = 25) -> List[ArxivPaper]:
         
     return results
 
+def _local_paper(result: Dict[str, Any]) -> ArxivPaper:
+    return ArxivPaper(
+        title=result["title"],
+        authors=result["authors"],
+        summary=result["abstract"],
+        pdf_url=f"https://arxiv.org/pdf/{result['paper_id']}",
+        published=result["published"] or "",
+        paper_url=f"http://arxiv.org/abs/{result['paper_id']}",
+        paper_id=result["paper_id"],
+        doi=result["doi"]
+    )
+
+def search_local_papers(query: str, max_results: int = 25) -> List[ArxivPaper]:
+    arxiv_index = get_arxiv_index()
+    if arxiv_index is None:
+        raise RuntimeError(f"No local arXiv index at {arxiv_index_path()}, see utils/arxiv_index.py")
+    return [_local_paper(result) for result in arxiv_index.search(query, max_results)]
+
+def search_semantic_papers(description: str, max_results: int = 25) -> List[ArxivPaper]:
+    """Nearest abstracts to the description itself, so differently-worded prior art is found too."""
+    vector_index = get_vector_index()
+    if vector_index is None:
+        return []
+    paper_ids = [paper_id for paper_id, _ in vector_index.search(description, max_results, source="arxiv")]
+    arxiv_index = get_arxiv_index()
+    if not paper_ids or arxiv_index is None:
+        return []
+    return [_local_paper(result) for result in arxiv_index.get(paper_ids)]
+
+def search_papers(query: str, max_results: int = 25) -> List[ArxivPaper]:
+    if search_backend == "local":
+        return search_local_papers(query, max_results)
+
+    try:
+        return search_api_papers(query, max_results)
+    except Exception as e:
+        # Keep serving from the local index (if one has been built) during arXiv outages
+        if get_arxiv_index() is None:
+            raise
+        print(f"arXiv API search failed ({e}), falling back to the local index")
+        return search_local_papers(query, max_results)
+
+async def retrieve_papers(query: str, description: str, max_papers: int) -> List[ArxivPaper]:
+    max_results = max(max_papers, retrieval_size)
+
+    async def timed(name, fn, *args):
+        # arxiv.Client is blocking, keep it off the event loop
+        with stage(name):
+            return await asyncio.to_thread(fn, *args)
+
+    semantic = timed("semantic_search", search_semantic_papers, description, max_results)
+    if semantic_search_mode == "only" and get_vector_index() is not None:
+        papers = await semantic
+    else:
+        keyword_papers, semantic_papers = await asyncio.gather(
+            timed("keyword_search", search_papers, query, max_results),
+            semantic,
+        )
+        papers = keyword_papers
+        if semantic_papers:
+            # Merge both rankings by reciprocal rank fusion
+            by_id = {paper.paper_id: paper for paper in semantic_papers + keyword_papers}
+            fused = reciprocal_rank_fusion([[p.paper_id for p in keyword_papers], [p.paper_id for p in semantic_papers]])
+            papers = [by_id[paper_id] for paper_id in fused[:max_results]]
+
+    # Cheap local pre-ranking so LLM calls are only spent on the most promising papers
+    with stage("prerank"):
+        keep = prerank(description, [f"{paper.title}\n{paper.summary}" for paper in papers], top_k=max_papers)
+    return [papers[i] for i in keep]
+
 """
 1. Analyze Input: Use LLM to take in description and produce keywords
 2. Search Arxiv: Currently using python library
-3. Analyze Papers: Use LLM to analyze papers and return the most relevant ones
+3. Pre-rank: Keep the max_papers results most similar to the description
+4. Analyze Papers: Use LLM to analyze papers and return the most relevant ones
 """
 async def search_by_description(description: str, max_papers: int = 10) -> List[ArxivPaper]:
     raw_query = await get_search_query(description)
     query = " ".join(textwrap.dedent(raw_query).split())
 
-    papers = search_papers(query, max_results=max_papers)
+    papers = await retrieve_papers(query, description, max_papers)
 
     print(f"Analyzing {len(papers)} Papers")
     sorted_papers = await score_and_sort_papers(papers, description)
 
-    return sorted_papers
\ No newline at end of file
+    return sorted_papers
+
+"""
+Same pipeline as search_by_description, but yields events as each stage finishes:
+  {"event": "query", "query": ...}
+  {"event": "paper", "paper": {...}}     (per paper, in scoring order; again if re-scored)
+  {"event": "done", "ranking": [paper_id, ...]}
+The API ends the stream with {"event": "error", ...} instead if this raises (see main.py).
+"""
+async def stream_search_by_description(description: str, max_papers: int = 10) -> AsyncIterator[Dict[str, Any]]:
+    raw_query = await get_search_query(description)
+    query = " ".join(textwrap.dedent(raw_query).split())
+    yield {"event": "query", "query": query}
+
+    papers = await retrieve_papers(query, description, max_papers)
+
+    print(f"Analyzing {len(papers)} Papers")
+    scored = {}
+    async for paper in iter_cascade_scored_papers(papers, description):
+        scored[paper.paper_id] = paper
+        yield {"event": "paper", "paper": asdict(paper)}
+
+    yield {"event": "done", "ranking": [paper.paper_id for paper in rank_papers(list(scored.values()))]}
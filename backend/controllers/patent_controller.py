@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
 
 @dataclass
 class Patent:
@@ -6,93 +6,211 @@ class Patent:
     title: str
     summary: str
     relevance_score: float = 0.0
+    # Number of multiplexed prompts that surfaced this patent
+    prompt_hits: int = 1
+    # Set when the strong model re-scored this patent (see utils/models.py)
+    reasoning: str = ""
 
 ######### Nick to paste new GPatentEngine implementation
 
 
-from anthropic import Anthropic
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor
+# bs4 and Selenium are imported where they're used: the API server imports this module
+# at startup, and most searches never open Chrome
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from functools import partial
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from typing import Any
+from typing import Any, Optional
 
+import json
 import os
 import re
-import requests
+import threading
+
+from utils.claims import chunk_claims, independent_claims, split_claims, truncate_to_tokens
+from utils.driver_pool import get_driver_pool, new_chrome_driver
+from utils.http_client import get_http_client
+from utils.llm import cached_system, create_message, current_usage, get_client
+from utils.models import (cascade_enabled, fast_model, query_max_tokens, reasoned_score_max_tokens,
+                          score_max_tokens, select_for_rescoring, strong_model, summary_max_tokens)
+from utils.patent_store import PatentDocument, get_patent_store
+from utils.prerank import prerank
+from utils.rate_limiter import current_priority, estimate_tokens
+from utils.timing import current_trace, stage
+from utils.vector_index import get_vector_index
 
 log = print
 
+# "http" scrapes FPO listings directly and only falls back to Chrome, "selenium" always uses Chrome
+fpo_search_backend = os.environ.get("FPO_SEARCH_BACKEND", "http")
+
+# Per-search limits on how many patents are in each pipeline stage at once
+patent_fetch_concurrency = int(os.environ.get("PATENT_FETCH_CONCURRENCY", 8))
+patent_summary_concurrency = int(os.environ.get("PATENT_SUMMARY_CONCURRENCY", 5))
+patent_score_concurrency = int(os.environ.get("PATENT_SCORE_CONCURRENCY", 5))
+
+# Max candidates per search that get summarized and scored by the LLM
+patent_prerank_top_k = int(os.environ.get("PATENT_PRERANK_TOP_K", 10))
+
+# Token budgets for patent summaries: documents above single_pass_tokens are trimmed to
+# their independent claims, then split into at most max_chunks chunks of chunk_tokens
+patent_summary_single_pass_tokens = int(os.environ.get("PATENT_SUMMARY_SINGLE_PASS_TOKENS", 6000))
+patent_summary_chunk_tokens = int(os.environ.get("PATENT_SUMMARY_CHUNK_TOKENS", 3000))
+patent_summary_max_chunks = int(os.environ.get("PATENT_SUMMARY_MAX_CHUNKS", 6))
+
+# Scoring prompts: the instructions and idea form a system prefix shared by every patent
+# of a search, the patent itself is the only per-call input. The prefix is usually far
+# below the minimum cacheable length, so it's only marked for caching for very long ideas.
+relevance_instructions = "Please calculate a relevance score between 0 and 1 between the idea and the patent. Provide only the score and no other commentary."
+reasoned_relevance_instructions = """Please calculate a relevance score between 0 and 1 between the idea and the patent, where 1 means the patent discloses the idea.
+Think about which elements of the idea the patent does and does not cover, then respond with JSON only:
+{"relevance_score": <float between 0 and 1>, "reasoning": "<one or two sentences>"}"""
+
+
 
 # id, title, summary, relevance_score
 
 
 class GPatentEngine:
-    def __init__(self, do_multiplex=False, max_elems=5):
+    def __init__(self, do_multiplex=False, max_elems=5, driver=None, driver_pool=None, fpo_backend=None):
         self.do_multiplex = do_multiplex
         self.max_elems = max_elems
-        # Set up the Chrome WebDriver
-        options = Options()
-        options.add_argument("--headless=new")
-        self.driver = webdriver.Chrome(options=options)
-        self.wait = WebDriverWait(driver=self.driver, timeout=5)
-
-        self.client = Anthropic(
-            api_key=os.environ.get("ANTHROPIC_API_KEY"),  # This is the default and can be omitted
-        )
+        self.fpo_backend = fpo_backend or fpo_search_backend
+        self.prerank_top_k = patent_prerank_top_k
+
+        # The WebDriver is only acquired when a Selenium search path actually needs it
+        self._driver = driver
+        self._driver_pool = driver_pool
+        self._driver_checkout = None
+        self._owns_driver = False
+        self._wait = None
+        self._driver_lock = threading.RLock()
+        # Set when the browser fails mid-search, so close() hands it back as crashed
+        self._driver_error: Optional[BaseException] = None
+
+        self._fetch_slots = threading.BoundedSemaphore(patent_fetch_concurrency)
+        self._summary_slots = threading.BoundedSemaphore(patent_summary_concurrency)
+        self._score_slots = threading.BoundedSemaphore(patent_score_concurrency)
+
+        self.client = get_client()
+        self.store = get_patent_store()
+        # Captured here since the engine's worker threads don't inherit the caller's context
+        self.priority = current_priority.get()
+        self.usage = current_usage.get()
+        self.trace = current_trace()
+
+    @property
+    def driver(self):
+        with self._driver_lock:
+            if self._driver is None:
+                if self._driver_pool is not None:
+                    self._driver_checkout = self._driver_pool.checkout()
+                    self._driver = self._driver_checkout.__enter__()
+                else:
+                    # Set up our own Chrome WebDriver
+                    self._driver = new_chrome_driver()
+                    self._owns_driver = True
+            return self._driver
+
+    @property
+    def wait(self):
+        with self._driver_lock:
+            if self._wait is None:
+                from selenium.webdriver.support.ui import WebDriverWait
+                self._wait = WebDriverWait(driver=self.driver, timeout=5)
+            return self._wait
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """
+        Return a pooled driver, or quit the driver we launched ourselves. error (or the
+        WebDriverException a search hit) is passed on to the pool checkout, so a
+        crashed browser is recycled rather than given to the next search.
+        """
+        error = error or self._driver_error
+        if self._driver_checkout is not None:
+            if error is None:
+                self._driver_checkout.__exit__(None, None, None)
+            else:
+                self._driver_checkout.__exit__(type(error), error, error.__traceback__)
+        elif self._owns_driver:
+            self._driver.quit()
+        self._driver = None
+        self._driver_checkout = None
+        self._owns_driver = False
+        self._wait = None
+        self._driver_error = None
+
+    @contextmanager
+    def _recording_driver_errors(self):
+        from selenium.common.exceptions import WebDriverException
+
+        try:
+            yield
+        except WebDriverException as e:
+            self._driver_error = e
+            raise
 
     def _selenium_patent_search(self,
                                 destination,
                                 wait_fn,
                                 fetch_fn,
                                 process_fn):
-        self.driver.get(destination)
-        try:
-            wait_fn()
-        except Exception as e:
-            log(f"Wait function raised {e}, so aborting this search branch.")
-            return []
-
-        # Parse through search results as they load
-        previous_count = 0
-        while True:
-            # Get all currently loaded search result elements
-            results = fetch_fn()
-
-            # We're done? Exit loop
-            if len(results) == previous_count:
-                break
-
-            # Process newly loaded elements
-            for result in results[previous_count:]:
-                try:
-                    process_fn(result)
-                except Exception as e:
-                    log(f"Encountered error when parsing patent results: {e}")
-
-            previous_count = len(results)
-
-            # Scroll to bottom to trigger more results [optional]
-            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        from selenium.common.exceptions import TimeoutException, WebDriverException
+
+        # Prompts may be searched in parallel, but they share a single browser
+        with self._driver_lock, stage("chrome", self.trace), self._recording_driver_errors():
+            self.driver.get(destination)
+            try:
+                wait_fn()
+            except Exception as e:
+                # A timeout only means the page had no results, any other browser error
+                # means the browser can't be trusted with the next search
+                if isinstance(e, WebDriverException) and not isinstance(e, TimeoutException):
+                    self._driver_error = e
+                log(f"Wait function raised {e}, so aborting this search branch.")
+                return []
+
+            # Parse through search results as they load
+            previous_count = 0
+            while True:
+                # Get all currently loaded search result elements
+                results = fetch_fn()
+
+                # We're done? Exit loop
+                if len(results) == previous_count:
+                    break
+
+                # Process newly loaded elements
+                for result in results[previous_count:]:
+                    try:
+                        process_fn(result)
+                    except Exception as e:
+                        log(f"Encountered error when parsing patent results: {e}")
+
+                previous_count = len(results)
+
+                # Scroll to bottom to trigger more results [optional]
+                self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
 
     def _patent_direct_search(self, query: str) -> list[str]:
         target = "https://patents.google.com/"
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.common.keys import Keys
+        from selenium.webdriver.support import expected_conditions as EC
 
         if len(query.strip().split()) > 20:
-            claude_output = self.client.messages.create(
+            claude_output = create_message(
+                self.client,
+                priority=self.priority,
+                usage=self.usage,
+                cache=True,
                 messages=[
                     {
                         "role": "user",
                         "content": f"Please summarize the following text in 20 words as accurately as possible. You get $100 for not introducing any inaccuracies.\nTEXT: {query}"
                     }
                 ],
-                model="claude-3-7-sonnet-latest",
-                max_tokens=1028
+                model=strong_model,
+                max_tokens=query_max_tokens
             )
 
             query = claude_output.content[0].text
@@ -124,6 +242,9 @@ class GPatentEngine:
 
     def _patent_internet_search(self, query: str) -> list[str]:
         target = "https://www.duckduckgo.com/"
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.common.keys import Keys
+        from selenium.webdriver.support import expected_conditions as EC
 
         def _wait_for_search_box(driver, wait):
             wait.until(EC.presence_of_element_located((By.NAME, "q")))
@@ -152,8 +273,47 @@ class GPatentEngine:
                                      process_fn=_process_fn)
         return patents
 
+    @staticmethod
+    def _normalize_fpo_number(patent_no: str) -> str:
+        patent_no = patent_no.strip().upper()
+        if not patent_no.startswith("US"):
+            patent_no = "US" + patent_no
+        return patent_no
+
+    def _patent_fpo_http_search(self, query: str) -> list[str]:
+        # Same listing the search box leads to, fetched without a browser
+        resp = get_http_client().get_sync(
+            "https://www.freepatentsonline.com/result.html",
+            params={"sort": "relevance", "srch": "top", "query_txt": query, "submit": "", "patents_us": "on"},
+        )
+        resp.raise_for_status()
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(resp.text, "html.parser")
+
+        listing = soup.find(class_="listing_table")
+        if listing is None:
+            return []
+
+        cells = listing.find_all("td", attrs={"width": lambda width: width and "15%" in width})[:self.max_elems]
+        return [self._normalize_fpo_number(cell.get_text()) for cell in cells if cell.get_text().strip()]
+
     def _patent_fpo_search(self, query: str) -> list[str]:
+        if self.fpo_backend == "http":
+            try:
+                patents = self._patent_fpo_http_search(query)
+                if patents:
+                    return patents
+                log("FPO HTTP search returned no results, falling back to Selenium.")
+            except Exception as e:
+                log(f"FPO HTTP search raised {e}, falling back to Selenium.")
+
+        return self._patent_fpo_selenium_search(query)
+
+    def _patent_fpo_selenium_search(self, query: str) -> list[str]:
         target = "https://www.freepatentsonline.com/"
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.common.keys import Keys
+        from selenium.webdriver.support import expected_conditions as EC
 
         def _wait_for_search_box(driver, wait):
             wait.until(EC.presence_of_element_located((By.NAME, "query_txt")))
@@ -170,10 +330,7 @@ class GPatentEngine:
         patents = []
 
         def _process_fn(result) -> None:
-            patent_no = result.text.strip().upper()
-            if not patent_no.startswith("US"):
-                patent_no = "US" + patent_no
-            patents.append(patent_no)
+            patents.append(self._normalize_fpo_number(result.text))
 
         self._selenium_patent_search(destination=target,
                                      wait_fn=partial(_wait_for_search_box, driver=self.driver, wait=self.wait),
@@ -181,42 +338,148 @@ class GPatentEngine:
                                      process_fn=_process_fn)
         return patents
 
-    def _search(self, query: str) -> list[str]:
-        patents: set[str] = set()
+    def _retrieve(self, query: str) -> list[str]:
+        """Candidate patent IDs for a single prompt, in search result order."""
+        patents: dict[str, None] = {}
 
         # ** Google is detecting us as bots, sad. Deal with this later. **
         # for patent_candidate in self._patent_direct_search(query):
-        #     if patent_candidate not in patents:
-        #         patents.add(patent_candidate)
+        #     patents.setdefault(patent_candidate)
 
-        for patent_candidate in self._patent_fpo_search(query):
-            if patent_candidate not in patents:
-                patents.add(patent_candidate)
+        with stage("retrieve", self.trace):
+            fpo_candidates = self._patent_fpo_search(query)
+        for patent_candidate in fpo_candidates:
+            patents.setdefault(patent_candidate)
         # for patent_candidate in self._patent_internet_search(query):
-        #     if patent_candidate not in patents:
-        #         patents.add(patent_candidate)
+        #     patents.setdefault(patent_candidate)
 
         with ThreadPoolExecutor(max_workers=20) as executor:
             allowlist = list(executor.map(partial(self.is_prior_art, query), patents))
 
-        return [self.id_to_patent(query, patent_id) for patent_id, is_prior_art in zip(patents, allowlist) if
-                is_prior_art]
-
-    def search(self, query: str) -> list[str]:
-        prompts = self._multiplex(query)
-
-        patents = []
-        for prompt in prompts:
-            patents.extend(self._search(prompt))
-
-        return list(set(patents))
+        return [patent_id for patent_id, is_prior_art in zip(patents, allowlist) if is_prior_art]
+
+    def _fetch_documents(self, patent_ids: list[str]) -> dict[str, PatentDocument]:
+        """Fetch (or load from the store) every patent, dropping any that fail."""
+        def fetch(patent_id):
+            try:
+                return self.fetch_document(patent_id)
+            except Exception as e:
+                log(f"Failed to fetch patent {patent_id}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(1, len(patent_ids))) as executor:
+            documents = dict(zip(patent_ids, executor.map(fetch, patent_ids)))
+        return {patent_id: document for patent_id, document in documents.items() if document is not None}
+
+    def _prerank(self, idea: str, patent_ids: list[str]) -> dict[str, Optional[PatentDocument]]:
+        """
+        Keep the prerank_top_k candidates whose title and abstract are most similar to the
+        idea, so summaries and LLM scores are only spent on those. Small candidate sets skip
+        this and go straight through the pipeline.
+        """
+        if len(patent_ids) <= self.prerank_top_k:
+            return dict.fromkeys(patent_ids)
+
+        documents = self._fetch_documents(patent_ids)
+        fetched_ids = list(documents)
+        texts = [f"{documents[patent_id].title or ''}\n{documents[patent_id].abstract or ''}" for patent_id in fetched_ids]
+        with stage("prerank", self.trace):
+            keep = prerank(idea, texts, top_k=self.prerank_top_k)
+        log(f"Pre-ranking kept {len(keep)} of {len(patent_ids)} patent candidates")
+        return {fetched_ids[i]: documents[fetched_ids[i]] for i in keep}
+
+    def _process(self, idea: str, candidates: dict[str, list[str]], on_patent=None) -> list[dict[str, Any]]:
+        """
+        Run every candidate through fetch -> summary -> score concurrently; id_to_patent
+        bounds how many are in each stage at once. candidates maps each patent ID to the
+        prompts that surfaced it, which is kept on the result as prompt_hits.
+
+        With the model cascade on, the top and borderline patents are then re-scored by
+        the strong model and passed to on_patent a second time with their final score.
+        """
+        documents = self._prerank(idea, list(candidates))
+
+        results = []
+        with ThreadPoolExecutor(max_workers=max(1, len(documents))) as executor:
+            futures = {executor.submit(self.id_to_patent, idea, patent_id, document): patent_id
+                       for patent_id, document in documents.items()}
+            for future in as_completed(futures):
+                patent_id = futures[future]
+                try:
+                    patent = future.result()
+                except Exception as e:
+                    log(f"Failed to process patent {patent_id}: {e}")
+                    continue
+                patent["prompt_hits"] = len(candidates[patent_id])
+                if on_patent is not None:
+                    on_patent(patent)
+                results.append(patent)
+
+            if cascade_enabled:
+                # Select in input order rather than completion order, so ties are broken the same way every run
+                order = {patent_id: i for i, patent_id in enumerate(documents)}
+                ranked = sorted(results, key=lambda patent: order[patent["id"]])
+                rescore = [ranked[i] for i in sorted(select_for_rescoring([p["relevance_score"] for p in ranked]))]
+                futures = {executor.submit(self._rescore, idea, patent): patent for patent in rescore}
+                for future in as_completed(futures):
+                    patent = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        log(f"Failed to re-score patent {patent['id']}: {e}")
+                        continue
+                    if on_patent is not None:
+                        on_patent(patent)
+        return results
+
+    def _rescore(self, idea: str, patent: dict[str, Any]) -> None:
+        with self._score_slots, stage("rescore", self.trace):
+            patent["relevance_score"], patent["reasoning"] = self.rescore_relevance(idea, patent["summary"])
+
+    def _search(self, query: str, on_patent=None) -> list[dict[str, Any]]:
+        return self._process(query, {patent_id: [query] for patent_id in self._retrieve(query)}, on_patent=on_patent)
+
+    def search(self, query: str, on_patent=None, on_prompts=None) -> list[dict[str, Any]]:
+        """
+        on_prompts is called with the (multiplexed) search prompts and on_patent with each
+        scored patent dict as soon as it is ready, so callers can stream progress.
+        """
+        with stage("multiplex", self.trace):
+            prompts = self._multiplex(query)
+        if on_prompts is not None:
+            on_prompts(prompts)
+
+        # Fan retrieval for the multiplexed prompts out in parallel
+        with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
+            prompt_candidates = list(executor.map(self._retrieve, prompts))
+
+        # Fan in: union the candidates so each patent is fetched, summarized and scored
+        # exactly once (against the original idea), remembering which prompts found it
+        candidates: dict[str, list[str]] = {}
+        for prompt, patent_ids in zip(prompts, prompt_candidates):
+            for patent_id in patent_ids:
+                candidates.setdefault(patent_id, []).append(prompt)
+
+        # Stored patents that are semantically close to the idea, whatever their wording
+        vector_index = get_vector_index()
+        if vector_index is not None:
+            for patent_id, _ in vector_index.search(query, self.max_elems, source="patent"):
+                candidates.setdefault(patent_id, []).append("semantic index")
+
+        return self._process(query, candidates, on_patent=on_patent)
 
     def _multiplex(self, query: str, count=5) -> list[str]:
         if not self.do_multiplex:
             return [query]
 
-        def rephrase():
-            claude_output = self.client.messages.create(
+        def rephrase(i):
+            # Salt with the index so the cached rephrasings stay distinct
+            claude_output = create_message(
+                self.client,
+                priority=self.priority,
+                usage=self.usage,
+                cache=True,
+                cache_salt=i,
                 system="You are an assistant for a patent law firm helping a client do prior art discovery for a patent they are interested in pursuing. Please rephrase their idea to be as clear and brief as possible so that our interns don't make any mistakes while researching. State **ONLY** the idea and no other commentary.",
                 messages=[
                     {
@@ -224,13 +487,13 @@ class GPatentEngine:
                         "content": f"IDEA: {query}",
                     }
                 ],
-                model="claude-3-7-sonnet-latest",
-                max_tokens=1024,
+                model=strong_model,
+                max_tokens=query_max_tokens,
             )
             return claude_output.content[0].text
 
         with ThreadPoolExecutor(max_workers=count) as executor:
-            futures = [executor.submit(rephrase) for _ in range(count)]
+            futures = [executor.submit(rephrase, i) for i in range(count)]
             results = [f.result() for f in futures]
 
         return [query] + results
@@ -255,16 +518,21 @@ class GPatentEngine:
         # Clause is **quite** aggressive here. Tune later.
         return True
 
-    def calculate_relevance_score(self, idea, summary):
-        claude_output = self.client.messages.create(
+    def calculate_relevance_score(self, idea, summary, model=fast_model):
+        claude_output = create_message(
+            self.client,
+            priority=self.priority,
+            usage=self.usage,
+            temperature=0,
+            system=cached_system(relevance_instructions, f"IDEA: {idea}", model=model),
             messages=[
                 {
                     "role": "user",
-                    "content": f"Please calculate a relevance score between 0 and 1 between the idea and the patent. Provide only the score and no other commentary. IDEA: {idea}\nPATENT: {summary}",
+                    "content": f"PATENT: {summary}",
                 }
             ],
-            model="claude-3-7-sonnet-latest",
-            max_tokens=8192,
+            model=model,
+            max_tokens=score_max_tokens,
         )
 
         raw_output = claude_output.content[0].text
@@ -273,34 +541,123 @@ class GPatentEngine:
         except (ValueError, TypeError):
             return 0.0
 
+    def rescore_relevance(self, idea, summary) -> tuple[float, str]:
+        """Second cascade tier: (score, reasoning) from the strong model."""
+        claude_output = create_message(
+            self.client,
+            priority=self.priority,
+            usage=self.usage,
+            temperature=0,
+            system=cached_system(reasoned_relevance_instructions, f"IDEA: {idea}", model=strong_model),
+            messages=[
+                {
+                    "role": "user",
+                    "content": f"PATENT: {summary}",
+                }
+            ],
+            model=strong_model,
+            max_tokens=reasoned_score_max_tokens,
+        )
+
+        raw_output = claude_output.content[0].text
+        try:
+            result = json.loads(raw_output[raw_output.index("{"):raw_output.rindex("}") + 1])
+            return min(1.0, max(0.0, float(result["relevance_score"]))), str(result.get("reasoning", ""))
+        except (ValueError, KeyError, TypeError):
+            return min(1.0, max(0.0, self.calculate_relevance_score(idea, summary, model=strong_model))), ""
+
     def get_patent_summary(self, props):
-        claude_output = self.client.messages.create(
+        """
+        Summarize a patent within a bounded token budget. Short patents go to the LLM in
+        one pass. Longer ones lose their dependent claims first, and if they still don't
+        fit, their independent claims are summarized in parallel chunks that are then
+        merged, so at most two rounds of bounded-size calls are made per patent.
+        """
+        if estimate_tokens(str(props)) <= patent_summary_single_pass_tokens:
+            return self._summarize(props)
+
+        claims = independent_claims(split_claims(props.get("claims")))
+        trimmed = {**props, "claims": claims}
+        if estimate_tokens(str(trimmed)) <= patent_summary_single_pass_tokens:
+            return self._summarize(trimmed)
+
+        chunks = chunk_claims(claims, patent_summary_chunk_tokens, patent_summary_max_chunks)
+        log(f"Summarizing {len(claims)} independent claims of {props.get('title')!r} in {len(chunks)} chunks")
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            claim_summaries = list(executor.map(self._summarize_claims, chunks))
+        return self._summarize({
+            "title": props.get("title"),
+            "abstract": truncate_to_tokens(props.get("abstract") or "", patent_summary_chunk_tokens),
+            "claim summaries": claim_summaries,
+        })
+
+    def _summarize(self, props):
+        claude_output = create_message(
+            self.client,
+            priority=self.priority,
+            usage=self.usage,
+            cache=True,
             messages=[
                 {
                     "role": "user",
                     "content": f"Summarize this patent into 100 english words or fewer:\n{props}",
                 }
             ],
-            model="claude-3-7-sonnet-latest",
-            max_tokens=8192,
+            model=strong_model,
+            max_tokens=summary_max_tokens,
         )
 
         return claude_output.content[0].text
 
-    def id_to_patent(self, idea, patent_id) -> dict[str, Any]:
-        props = self.get_patent_claims(patent_id)
-        summary = self.get_patent_summary(props)
+    def _summarize_claims(self, claims: list[str]) -> str:
+        claims_text = "\n".join(claims)
+        claude_output = create_message(
+            self.client,
+            priority=self.priority,
+            usage=self.usage,
+            cache=True,
+            messages=[
+                {
+                    "role": "user",
+                    "content": f"Summarize what these patent claims cover in 100 english words or fewer:\n{claims_text}",
+                }
+            ],
+            model=fast_model,
+            max_tokens=summary_max_tokens,
+        )
+
+        return claude_output.content[0].text
+
+    def fetch_document(self, patent_id) -> PatentDocument:
+        # Only hit the network for patents we haven't seen before
+        with self._fetch_slots, stage("fetch", self.trace):
+            return self.store.get_or_fetch(patent_id, self.get_patent_claims)
+
+    def id_to_patent(self, idea, patent_id, document=None) -> dict[str, Any]:
+        if document is None:
+            document = self.fetch_document(patent_id)
+        props = document.props
+        summary = document.summary
+        if summary is None:
+            with self._summary_slots, stage("summarize", self.trace):
+                summary = self.get_patent_summary(props)
+            self.store.set_summary(patent_id, summary)
+        with self._score_slots, stage("score", self.trace):
+            relevance_score = self.calculate_relevance_score(idea, summary,
+                                                             model=fast_model if cascade_enabled else strong_model)
         return {
             "id": patent_id,
-            "title": props.get("title", "N/A"),
+            "title": props.get("title") or "N/A",
             "summary": summary,
-            "relevance_score": self.calculate_relevance_score(idea, summary),
+            "relevance_score": relevance_score,
         }
 
     @staticmethod
     def get_gpatent_claims(patent_id) -> dict[str, str]:
         url = f"https://patents.google.com/patent/{patent_id}/en"
-        resp = requests.get(url)
+        resp = get_http_client().get_sync(url)
+        resp.raise_for_status()
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(resp.text, "html.parser")
 
         print(resp.text)
@@ -314,7 +671,9 @@ class GPatentEngine:
     @staticmethod
     def get_patent_claims(patent_id) -> dict[str, str]:
         url = f"https://freepatentsonline.com/{patent_id}.html"
-        resp = requests.get(url)
+        resp = get_http_client().get_sync(url)
+        resp.raise_for_status()
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(resp.text, "html.parser")
 
         title = soup.find('div', string="Title:").find_next_sibling('div').text
@@ -340,7 +699,28 @@ class GPatentEngine:
 
 # Start controller code
 
-from typing import List
+from typing import AsyncIterator, List
+import asyncio
+
+def _pooled_search(description: str, on_patent=None, on_prompts=None) -> list[dict[str, Any]]:
+    # Chrome is only checked out of the pool if a search falls back to Selenium
+    engine = GPatentEngine(driver_pool=get_driver_pool())
+    try:
+        return engine.search(description, on_patent=on_patent, on_prompts=on_prompts)
+    finally:
+        engine.close()
+
+def _to_patent(patent_dict: dict[str, Any]) -> Patent:
+    return Patent(id=patent_dict['id'], title=patent_dict['title'], summary=patent_dict['summary'],
+                  relevance_score=patent_dict['relevance_score'], prompt_hits=patent_dict.get('prompt_hits', 1),
+                  reasoning=patent_dict.get('reasoning', ''))
+
+def rank_patents(patent_dicts: list[dict[str, Any]]) -> List[Patent]:
+    # Filter out patents with relevance score of 0 and sort the rest, breaking ties by
+    # how many multiplexed prompts found the patent
+    patent_dicts = [p for p in patent_dicts if p['relevance_score'] > 0]
+    patent_dicts.sort(key=lambda dct: (dct['relevance_score'], dct.get('prompt_hits', 1)), reverse=True)
+    return [_to_patent(p) for p in patent_dicts]
 
 """
 1. Analyze Input: Use LLM to take in description and produce keywords
@@ -348,18 +728,49 @@ from typing import List
 3. Analyze Papers: Use LLM to analyze papers and return the most relevant ones
 """
 async def search_patents_by_description(description: str) -> List[Patent]:
-    engine = GPatentEngine()
-    try:
-        patent_dicts = engine.search(description)
-    finally:
-        engine.driver.quit()
+    # Selenium and the engine's LLM calls are blocking, keep them off the event loop
+    patent_dicts = await asyncio.to_thread(_pooled_search, description)
+    return rank_patents(patent_dicts)
 
-    # TODO convert patent IDs to actual values
-    patent_dicts = [p for p in patent_dicts if p['relevance_score'] > 0]
-    patent_dicts.sort(key=lambda dct: dict['relevance_score'], reverse=True)
+PATENT_SEARCH_JOB = "patent_search"
 
-    patents = [Patent(id=p['id'], title=p['title'], summary=p['summary'], relevance_score=p['relevance_score']) for p in patent_dicts]
-    return patents
+def run_patent_search_job(payload: dict[str, Any], report_partial) -> list[dict[str, Any]]:
+    """
+    Job queue handler: report each scored patent as it's ready, return the ranked list.
+    A patent re-scored by the cascade replaces its first-pass entry.
+    """
+    patent_dicts = _pooled_search(payload["description"],
+                                  on_patent=lambda patent: report_partial(asdict(_to_patent(patent)), replace_key="id"))
+    return [asdict(patent) for patent in rank_patents(patent_dicts)]
+
+"""
+Same pipeline as search_patents_by_description, but yields events as each stage finishes:
+  {"event": "query", "queries": [...]}
+  {"event": "patent", "patent": {...}}   (per scored patent; again if re-scored)
+  {"event": "done", "ranking": [patent_id, ...]}
+The API ends the stream with {"event": "error", ...} instead if this raises (see main.py).
+"""
+async def stream_patents_by_description(description: str) -> AsyncIterator[dict[str, Any]]:
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    # The engine runs in a worker thread, hand its events back to the event loop
+    def emit(event: dict[str, Any]) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    search = asyncio.ensure_future(asyncio.to_thread(
+        _pooled_search,
+        description,
+        on_patent=lambda patent: emit({"event": "patent", "patent": asdict(_to_patent(patent))}),
+        on_prompts=lambda prompts: emit({"event": "query", "queries": prompts}),
+    ))
+    search.add_done_callback(lambda _: events.put_nowait(None))
+
+    while (event := await events.get()) is not None:
+        yield event
+
+    patents = rank_patents(await search)
+    yield {"event": "done", "ranking": [patent.id for patent in patents]}
 
 
 # Let's test the search patents by description code here
@@ -1,14 +1,62 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from controllers.arxiv_controller import search_by_description, ArxivPaper
-from controllers.patent_controller import search_patents_by_description, Patent
-from typing import List
 from dotenv import load_dotenv
 
+# Loaded once, before the modules below read their configuration at import
 load_dotenv()
 
-app = FastAPI()
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from controllers.arxiv_controller import search_by_description, stream_search_by_description, ArxivPaper
+from controllers.patent_controller import PATENT_SEARCH_JOB, fpo_search_backend, run_patent_search_job, search_patents_by_description, stream_patents_by_description, Patent
+from typing import Any, AsyncIterator, List, Optional
+from utils.driver_pool import get_driver_pool
+from utils.http_client import close_http_client, get_http_client
+from utils.llm import close_clients, get_async_client, get_client
+from utils.job_queue import JobWorkerPool, get_job_queue
+from utils.metrics import gauge, histogram, registry
+from utils.single_flight import SingleFlight, normalize_text
+from utils.timing import current_request_id
+import asyncio
+import json
+import os
+import time
+import uuid
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared clients are built here rather than on import, so `uvicorn --reload` restarts
+    # and new workers only pay for them once they actually start serving
+    await asyncio.to_thread(get_client)
+    get_async_client()
+    await asyncio.to_thread(get_http_client)
+
+    # With the selenium FPO backend every patent search needs Chrome, so launch the pool up
+    # front. With the default http backend Chrome is only a fallback, launched on first use.
+    driver_pool = get_driver_pool()
+    if fpo_search_backend == "selenium":
+        await asyncio.to_thread(driver_pool.warm)
+
+    # Background jobs normally run in worker.py processes, but can also be run in-process
+    job_workers = None
+    in_process_workers = int(os.environ.get("JOB_WORKERS_IN_PROCESS", 0))
+    if in_process_workers > 0:
+        job_workers = JobWorkerPool(get_job_queue(), {PATENT_SEARCH_JOB: run_patent_search_job}, concurrency=in_process_workers)
+        job_workers.start()
+
+    yield
+
+    if job_workers is not None:
+        await asyncio.to_thread(job_workers.stop)
+    await asyncio.to_thread(driver_pool.close)
+    await asyncio.to_thread(close_http_client)
+    await close_clients()
+
+app = FastAPI(lifespan=lifespan)
+
+# Identical searches arriving together (or within the TTL) share one pipeline run
+search_flights = SingleFlight(ttl_seconds=float(os.environ.get("SEARCH_RESULT_TTL_SECONDS", 30)))
 
 # Allow only the frontend running at localhost:3000
 origins = [
@@ -23,6 +71,35 @@ app.add_middleware(
     allow_headers=["*"],    # You can restrict headers if needed
 )
 
+http_in_flight = gauge("http_requests_in_flight", "API requests being handled")
+http_seconds = histogram("http_request_duration_seconds", "API request latency until the response starts",
+                         ("method", "route", "status"))
+
+# Tag the stage spans logged while handling a request with one id, taken from
+# X-Request-ID when the caller sends one and echoed back in the response
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = current_request_id.set(request_id)
+    http_in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        http_in_flight.dec()
+        route = request.scope.get("route")
+        http_seconds.observe(time.perf_counter() - start, method=request.method,
+                             route=route.path if route else "unmatched", status=str(status))
+        current_request_id.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.exposition(), media_type="text/plain; version=0.0.4")
+
 class SearchRequest(BaseModel):
     description: str
     max_papers: int = 10
@@ -30,12 +107,60 @@ class SearchRequest(BaseModel):
 # TODO: response object?
 @app.post("/api/search", response_model=List[ArxivPaper])
 async def search_papers(request: SearchRequest):
-    papers = await search_by_description(request.description, request.max_papers)
+    key = ("papers", normalize_text(request.description), request.max_papers)
+    papers = await search_flights.run(key, lambda: search_by_description(request.description, request.max_papers))
     return papers
 
 # TODO actually return more info about patent
 @app.post("/api/search_patents", response_model=List[Patent])
 async def search_patents(request: SearchRequest):
     # TODO call search func from patent controller
-    patents = await search_patents_by_description(request.description)
-    return patents
\ No newline at end of file
+    key = ("patents", normalize_text(request.description))
+    patents = await search_flights.run(key, lambda: search_patents_by_description(request.description))
+    return patents
+
+class JobCreated(BaseModel):
+    id: str
+
+class PatentJobStatus(BaseModel):
+    id: str
+    status: str
+    partial_results: List[Patent]
+    results: Optional[List[Patent]] = None
+    error: Optional[str] = None
+
+# Background patent search: POST returns a job id right away, poll GET for progress
+@app.post("/api/jobs/search_patents", response_model=JobCreated, status_code=202)
+async def create_patent_search_job(request: SearchRequest):
+    job_id = await asyncio.to_thread(get_job_queue().enqueue, PATENT_SEARCH_JOB, {"description": request.description})
+    return JobCreated(id=job_id)
+
+@app.get("/api/jobs/{job_id}", response_model=PatentJobStatus)
+async def get_patent_search_job(job_id: str):
+    job = await asyncio.to_thread(get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return PatentJobStatus(id=job.id, status=job.status, partial_results=job.partial_results,
+                           results=job.result, error=job.error)
+
+async def _ndjson(events: AsyncIterator[dict[str, Any]]) -> AsyncIterator[str]:
+    try:
+        async for event in events:
+            yield json.dumps(event) + "\n"
+    except Exception as e:
+        # The 200 status is already sent, so a failure can only be reported in the stream;
+        # without this the client couldn't tell it apart from a search with no results
+        print(f"Streaming search failed: {e!r}")
+        yield json.dumps({"event": "error", "message": f"{type(e).__name__}: {e}"}) + "\n"
+
+# Streaming variants: one JSON event per line, see stream_search_by_description. A failed
+# search ends with {"event": "error", "message": ...} instead of the done event.
+@app.post("/api/search/stream")
+async def stream_search_papers(request: SearchRequest):
+    return StreamingResponse(_ndjson(stream_search_by_description(request.description, request.max_papers)),
+                             media_type="application/x-ndjson")
+
+@app.post("/api/search_patents/stream")
+async def stream_search_patents(request: SearchRequest):
+    return StreamingResponse(_ndjson(stream_patents_by_description(request.description)),
+                             media_type="application/x-ndjson")
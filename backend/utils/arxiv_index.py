@@ -0,0 +1,342 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterator, List, Optional
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+default_index_path = Path(__file__).resolve().parent.parent / ".cache" / "arxiv_index.sqlite3"
+
+"""
+Local arXiv search backend built from the arXiv metadata snapshot
+(arxiv-metadata-oai-snapshot.json, one JSON record per line).
+
+Papers live in a plain table and are mirrored into an FTS5 inverted index over title,
+abstract, authors and categories; queries are ranked with FTS5's BM25. The Boolean
+all:/ti:/abs:/au:/cat: syntax get_search_query emits is translated to FTS5 syntax.
+
+Build or update the index with:
+    python -m utils.arxiv_index ingest arxiv-metadata-oai-snapshot.json
+"""
+
+# BM25 column weights for (title, abstract, authors, categories)
+bm25_weights = (2.0, 1.0, 0.5, 0.5)
+
+_field_columns = {
+    "all": "{title abstract}",
+    "ti": "title",
+    "abs": "abstract",
+    "au": "authors",
+    "cat": "categories",
+}
+
+_query_token = re.compile(r'\(|\)|(?:(\w+):)?("[^"]*"|[^\s()]+)')
+_operators = ("AND", "OR", "NOT")
+
+_schema = """
+CREATE TABLE IF NOT EXISTS papers (
+    id INTEGER PRIMARY KEY,
+    paper_id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    abstract TEXT NOT NULL,
+    authors TEXT NOT NULL,
+    categories TEXT NOT NULL,
+    published TEXT,
+    doi TEXT,
+    update_date TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+    title, abstract, authors, categories,
+    content='papers', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS papers_ai AFTER INSERT ON papers BEGIN
+    INSERT INTO papers_fts(rowid, title, abstract, authors, categories)
+    VALUES (new.id, new.title, new.abstract, new.authors, new.categories);
+END;
+CREATE TRIGGER IF NOT EXISTS papers_ad AFTER DELETE ON papers BEGIN
+    INSERT INTO papers_fts(papers_fts, rowid, title, abstract, authors, categories)
+    VALUES ('delete', old.id, old.title, old.abstract, old.authors, old.categories);
+END;
+CREATE TRIGGER IF NOT EXISTS papers_au AFTER UPDATE ON papers BEGIN
+    INSERT INTO papers_fts(papers_fts, rowid, title, abstract, authors, categories)
+    VALUES ('delete', old.id, old.title, old.abstract, old.authors, old.categories);
+    INSERT INTO papers_fts(rowid, title, abstract, authors, categories)
+    VALUES (new.id, new.title, new.abstract, new.authors, new.categories);
+END;
+"""
+
+
+def _query_parts(query: str) -> List[str]:
+    """FTS5 tokens of an arXiv API query: parentheses, operators and column-filtered phrases."""
+    parts = []
+    for match in _query_token.finditer(query):
+        token = match.group(0)
+        field, term = match.group(1), match.group(2)
+        if token in ("(", ")"):
+            parts.append(token)
+        elif field is None and term in ("AND", "OR"):
+            parts.append(term)
+        elif field is None and term == "ANDNOT":
+            parts.append("NOT")
+        else:
+            column = _field_columns.get((field or "all").lower(), _field_columns["all"])
+            term = term.strip('"')
+            if not term:
+                continue
+            # Quote every term so punctuation (cs.AI, multi-word phrases) is treated literally
+            parts.append(f'{column} : "{term.replace(chr(34), chr(34) * 2)}"')
+    return parts
+
+
+def _repair(parts: List[str]) -> List[str]:
+    """
+    Make LLM-written query tokens parseable by FTS5: drop operators with a missing
+    operand, unmatched closing parentheses and empty groups, close unclosed groups,
+    and spell out the AND that FTS5 doesn't imply next to a group.
+    """
+    repaired: List[str] = []
+    depth = 0
+    for part in parts:
+        previous = repaired[-1] if repaired else None
+        if part in _operators:
+            if previous is None or previous in _operators or previous == "(":
+                continue
+        elif part == ")":
+            while repaired and repaired[-1] in _operators:
+                repaired.pop()
+            if depth == 0:
+                continue
+            depth -= 1
+            if repaired[-1] == "(":
+                repaired.pop()
+                continue
+        else:
+            if previous is not None and previous not in _operators and previous != "(":
+                repaired.append("AND")
+            if part == "(":
+                depth += 1
+        repaired.append(part)
+
+    while repaired and (repaired[-1] in _operators or repaired[-1] == "("):
+        if repaired.pop() == "(":
+            depth -= 1
+    return repaired + [")"] * depth
+
+
+def to_fts_query(query: str) -> str:
+    """
+    Translate an arXiv API query, e.g.
+        (all:dating OR ti:"recommender system") ANDNOT cat:cs.CR
+    into the equivalent FTS5 MATCH expression. Terms without a field prefix search
+    title and abstract, like all:. Malformed queries (a trailing AND, unbalanced
+    parentheses) are repaired as far as possible.
+    """
+    return " ".join(_repair(_query_parts(query)))
+
+
+def to_fts_terms_query(query: str) -> str:
+    """Every term of an arXiv API query OR-ed together, ignoring its Boolean structure."""
+    return " OR ".join(part for part in _query_parts(query) if part not in _operators and part not in ("(", ")"))
+
+
+class ArxivIndex:
+    def __init__(self, path: str | Path = default_index_path, read_only: bool = False):
+        """
+        Open (creating it if needed) the index at path. A read_only index must already
+        exist, and is never created or written by opening it.
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_schema)
+            self._conn.commit()
+        self._conn.row_factory = sqlite3.Row
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def get(self, paper_ids: List[str]) -> List[dict[str, Any]]:
+        """Papers by id, in the order given; unknown ids are skipped."""
+        placeholders = ", ".join("?" for _ in paper_ids)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT * FROM papers WHERE paper_id IN ({placeholders})", paper_ids).fetchall()
+        by_id = {row["paper_id"]: _row_result(row) for row in rows}
+        return [by_id[paper_id] for paper_id in paper_ids if paper_id in by_id]
+
+    def iter_documents(self) -> Iterator[tuple[str, str, str]]:
+        """(paper_id, title, abstract) of every indexed paper."""
+        with self._lock:
+            rows = self._conn.execute("SELECT paper_id, title, abstract FROM papers ORDER BY id").fetchall()
+        for row in rows:
+            yield row["paper_id"], row["title"], row["abstract"]
+
+    def search(self, query: str, max_results: int = 25) -> List[dict[str, Any]]:
+        """BM25-ranked papers matching an arXiv-syntax query, best first."""
+        fts_query = to_fts_query(query)
+        if not fts_query:
+            return []
+
+        try:
+            rows = self._match(fts_query, max_results)
+        except sqlite3.OperationalError as e:
+            # Whatever _repair missed, rather than failing the search
+            print(f"FTS5 rejected {fts_query!r} ({e}), searching for any of its terms instead")
+            rows = self._match(to_fts_terms_query(query), max_results)
+        return [_row_result(row) for row in rows]
+
+    def _match(self, fts_query: str, max_results: int) -> List[sqlite3.Row]:
+        weights = ", ".join(str(w) for w in bm25_weights)
+        with self._lock:
+            return self._conn.execute(f"""
+                SELECT papers.*
+                FROM papers_fts JOIN papers ON papers.id = papers_fts.rowid
+                WHERE papers_fts MATCH ?
+                ORDER BY bm25(papers_fts, {weights})
+                LIMIT ?
+            """, (fts_query, max_results)).fetchall()
+
+    def ingest(self, records: Iterator[dict[str, Any]], batch_size: int = 10000) -> tuple[int, int]:
+        """
+        Upsert snapshot records. Papers already indexed with the same or a newer
+        update_date are skipped, so re-running on a newer snapshot only touches what
+        changed. Returns (records seen, papers inserted or updated).
+        """
+        seen = changed = 0
+        batch = []
+
+        def flush():
+            nonlocal changed
+            with self._lock:
+                cursor = self._conn.executemany("""
+                    INSERT INTO papers (paper_id, title, abstract, authors, categories, published, doi, update_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(paper_id) DO UPDATE SET
+                        title = excluded.title,
+                        abstract = excluded.abstract,
+                        authors = excluded.authors,
+                        categories = excluded.categories,
+                        published = excluded.published,
+                        doi = excluded.doi,
+                        update_date = excluded.update_date
+                    WHERE excluded.update_date > COALESCE(papers.update_date, '')
+                """, batch)
+                # rowcount excludes the FTS trigger writes, so this counts papers only
+                changed += cursor.rowcount
+                self._conn.commit()
+            batch.clear()
+
+        for record in records:
+            seen += 1
+            batch.append(_record_row(record))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        return seen, changed
+
+
+def _row_result(row: sqlite3.Row) -> dict[str, Any]:
+    return {
+        "paper_id": row["paper_id"],
+        "title": row["title"],
+        "abstract": row["abstract"],
+        "authors": json.loads(row["authors"]),
+        "categories": row["categories"],
+        "published": row["published"],
+        "doi": row["doi"],
+    }
+
+
+def _clean(text: Optional[str]) -> str:
+    return " ".join((text or "").split())
+
+
+def _published(record: dict[str, Any]) -> Optional[str]:
+    versions = record.get("versions") or []
+    if versions:
+        try:
+            created = datetime.strptime(versions[0]["created"], "%a, %d %b %Y %H:%M:%S %Z")
+            return created.strftime("%Y-%m-%d")
+        except (KeyError, ValueError):
+            pass
+    return record.get("update_date")
+
+
+def _record_row(record: dict[str, Any]) -> tuple:
+    if record.get("authors_parsed"):
+        authors = [" ".join(part for part in (first, last) if part)
+                   for last, first, *_ in record["authors_parsed"]]
+    else:
+        authors = [_clean(author) for author in (record.get("authors") or "").split(",") if author.strip()]
+
+    return (
+        record["id"],
+        _clean(record.get("title")),
+        _clean(record.get("abstract")),
+        json.dumps(authors),
+        record.get("categories") or "",
+        _published(record),
+        record.get("doi"),
+        record.get("update_date") or "",
+    )
+
+
+def read_snapshot(path: str | Path) -> Iterator[dict[str, Any]]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+_arxiv_index: Optional[ArxivIndex] = None
+_arxiv_index_lock = threading.Lock()
+
+
+def arxiv_index_path() -> Path:
+    return Path(os.environ.get("ARXIV_INDEX_PATH", default_index_path))
+
+
+def get_arxiv_index() -> Optional[ArxivIndex]:
+    """Process-wide read-only index, configured from the environment, or None if it hasn't been built yet."""
+    global _arxiv_index
+    with _arxiv_index_lock:
+        if _arxiv_index is None and arxiv_index_path().exists():
+            _arxiv_index = ArxivIndex(arxiv_index_path(), read_only=True)
+        return _arxiv_index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local arXiv metadata index")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subcommands.add_parser("ingest", help="Add or update papers from an arXiv metadata snapshot")
+    ingest_parser.add_argument("snapshot", help="arxiv-metadata-oai-snapshot.json (JSONL)")
+    search_parser = subcommands.add_parser("search", help="Run a query against the index")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--max-results", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        index = ArxivIndex(arxiv_index_path())
+        start = time.perf_counter()
+        seen, changed = index.ingest(read_snapshot(args.snapshot))
+        print(f"Ingested {seen} records ({changed} new or updated) in {time.perf_counter() - start:.1f}s; "
+              f"index now holds {len(index)} papers")
+    else:
+        index = get_arxiv_index()
+        if index is None:
+            raise SystemExit(f"No arXiv index at {arxiv_index_path()}, ingest a snapshot first")
+        start = time.perf_counter()
+        results = index.search(args.query, args.max_results)
+        print(f"{len(results)} results in {(time.perf_counter() - start) * 1000:.1f}ms")
+        for result in results:
+            print(f"- {result['paper_id']}: {result['title']}")
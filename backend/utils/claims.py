@@ -0,0 +1,88 @@
+from typing import List, Optional, Sequence, Union
+import re
+
+from utils.rate_limiter import estimate_tokens
+
+"""
+Helpers for fitting patent claim sets into a token budget.
+
+Claims arrive either as one block of text ("1. A method ... 2. The method of claim 1,
+wherein ...") from freepatentsonline or as a list of claim texts from Google Patents.
+Dependent claims only narrow an independent claim, so they are the first thing dropped
+when a patent is too long to summarize in one pass.
+"""
+
+# "2. The method of claim 1" -- a claim number at the start of the text or after a
+# sentence end, followed by a capitalized word
+_claim_start = re.compile(r"(?:^|(?<=[.;:]\s)|(?<=[.;:]))\s*(\d{1,3})\s*\.\s+(?=[A-Z])")
+# A dependent claim opens by naming its parent: "The method of claim 1", "The system as
+# recited in any one of claims 1-3", "A device according to claim 2". An independent
+# claim can still mention another claim further into its preamble ("A system for
+# performing the method of claim 1"), so the reference must directly follow the
+# claimed subject, which for "A ..." claims can't contain a connecting word
+_claim_reference = (r"(?:of|in|to|by|with|from|under|according\s+to"
+                    r"|as\s+(?:claimed|recited|defined|set\s+forth|described)\s+in)"
+                    r"\s+(?:any\s+(?:one\s+)?of\s+)?claims?\s+\d+")
+_connective = r"(?:of|for|to|in|on|at|with|by|from|under|that|which|wherein|comprising|including|having|using)\b"
+_dependent = re.compile(
+    rf"^\s*(?:\d{{1,3}}\s*\.\s*)?"
+    rf"(?:the\s+(?:[^\s,;:]+\s+){{0,8}}?{_claim_reference}"
+    rf"|(?:an?\s+)?(?:(?!{_connective})[\w-]+\s+){{1,4}}?{_claim_reference})",
+    re.IGNORECASE,
+)
+
+
+def split_claims(claims: Union[str, Sequence[str], None]) -> List[str]:
+    """Individual claims, in order."""
+    if not claims:
+        return []
+    if not isinstance(claims, str):
+        return [" ".join(claim.split()) for claim in claims if claim.strip()]
+
+    text = " ".join(claims.split())
+    # Claim numbers must increase by one, which filters out numbers inside claim text
+    starts, expected = [], 1
+    for match in _claim_start.finditer(text):
+        if int(match.group(1)) == expected:
+            starts.append(match.start(1))
+            expected += 1
+    if not starts:
+        return [text]
+    bounds = starts + [len(text)]
+    return [text[bounds[i]:bounds[i + 1]].strip() for i in range(len(starts))]
+
+
+def is_dependent(claim: str) -> bool:
+    return _dependent.match(claim) is not None
+
+
+def independent_claims(claims: Sequence[str]) -> List[str]:
+    independent = [claim for claim in claims if not is_dependent(claim)]
+    # Never trim everything away, e.g. if the preamble heuristics misfire
+    return independent or list(claims[:1])
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    if estimate_tokens(text) <= budget:
+        return text
+    return text[:budget * 4].rsplit(" ", 1)[0] + " ..."
+
+
+def chunk_claims(claims: Sequence[str], chunk_tokens: int, max_chunks: Optional[int] = None) -> List[List[str]]:
+    """
+    Greedily pack claims, in order, into chunks of at most chunk_tokens. Claims longer
+    than a chunk are truncated; chunks past max_chunks are dropped.
+    """
+    chunks: List[List[str]] = []
+    size = 0
+    for claim in claims:
+        claim = truncate_to_tokens(claim, chunk_tokens)
+        tokens = estimate_tokens(claim)
+        if not chunks or size + tokens > chunk_tokens:
+            if max_chunks is not None and len(chunks) >= max_chunks:
+                break
+            chunks.append([])
+            size = 0
+        chunks[-1].append(claim)
+        size += tokens
+    return chunks
@@ -0,0 +1,156 @@
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
+import os
+import queue
+import threading
+
+# Selenium is only imported once a browser is actually launched
+if TYPE_CHECKING:
+    from selenium import webdriver
+
+log = print
+
+
+def new_chrome_driver() -> "webdriver.Chrome":
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    options.add_argument("--headless=new")
+    return webdriver.Chrome(options=options)
+
+
+class DriverPool:
+    """
+    Bounded pool of warm headless Chrome instances.
+
+    Drivers are checked out for one search at a time, health-checked on checkout,
+    reset (cookies, storage, blank page) when returned, and recycled after max_uses
+    searches or whenever a search crashes the browser.
+    """
+
+    def __init__(self,
+                 size: int = 2,
+                 max_uses: int = 50,
+                 checkout_timeout: Optional[float] = 120,
+                 driver_factory: Callable[[], "webdriver.Chrome"] = new_chrome_driver):
+        self.size = size
+        self.max_uses = max_uses
+        self.checkout_timeout = checkout_timeout
+        self.driver_factory = driver_factory
+
+        self._idle: queue.Queue = queue.Queue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._uses: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _create(self) -> "webdriver.Chrome":
+        driver = self.driver_factory()
+        with self._lock:
+            self._uses[id(driver)] = 0
+        return driver
+
+    def _discard(self, driver: "webdriver.Chrome") -> None:
+        with self._lock:
+            self._uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            log(f"Error quitting driver: {e}")
+
+    @staticmethod
+    def _is_healthy(driver: "webdriver.Chrome") -> bool:
+        try:
+            driver.execute_script("return 1;")
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _reset(driver: "webdriver.Chrome") -> None:
+        driver.delete_all_cookies()
+        driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+        driver.get("about:blank")
+
+    def warm(self) -> None:
+        """Launch drivers until every free slot has an idle driver."""
+        acquired = 0
+        while acquired < self.size and self._slots.acquire(blocking=False):
+            acquired += 1
+        try:
+            for _ in range(acquired - self._idle.qsize()):
+                self._idle.put(self._create())
+        finally:
+            for _ in range(acquired):
+                self._slots.release()
+
+    def _take(self) -> "webdriver.Chrome":
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                return self._create()
+            if self._is_healthy(driver):
+                return driver
+            log("Discarding unhealthy driver from pool")
+            self._discard(driver)
+
+    def _give_back(self, driver: "webdriver.Chrome", crashed: bool) -> None:
+        with self._lock:
+            self._uses[id(driver)] = uses = self._uses.get(id(driver), 0) + 1
+
+        if self._closed or crashed or uses >= self.max_uses:
+            self._discard(driver)
+            return
+
+        try:
+            self._reset(driver)
+        except Exception as e:
+            log(f"Failed to reset driver, recycling it: {e}")
+            self._discard(driver)
+            return
+        self._idle.put(driver)
+
+    @contextmanager
+    def checkout(self) -> Iterator["webdriver.Chrome"]:
+        from selenium.common.exceptions import WebDriverException
+
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise TimeoutError("Timed out waiting for a free browser")
+        try:
+            driver = self._take()
+            crashed = False
+            try:
+                yield driver
+            except WebDriverException:
+                crashed = True
+                raise
+            finally:
+                self._give_back(driver, crashed)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+_driver_pool: Optional[DriverPool] = None
+_driver_pool_lock = threading.Lock()
+
+
+def get_driver_pool() -> DriverPool:
+    """Process-wide pool, configured from the environment."""
+    global _driver_pool
+    with _driver_pool_lock:
+        if _driver_pool is None:
+            _driver_pool = DriverPool(
+                size=int(os.environ.get("CHROME_POOL_SIZE", 2)),
+                max_uses=int(os.environ.get("CHROME_POOL_MAX_USES", 50)),
+            )
+        return _driver_pool
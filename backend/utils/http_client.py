@@ -0,0 +1,150 @@
+from typing import Optional
+from urllib.parse import urlsplit
+import asyncio
+import httpx
+import os
+import random
+import threading
+import time
+
+from utils.metrics import counter, histogram
+
+log = print
+
+"""
+Shared HTTP client for scraping patent pages.
+
+One httpx.AsyncClient (keep-alive connection pool, optional HTTP/2) lives on a
+dedicated event loop thread, so it can be used both from async code (get) and from the
+patent engine's worker threads (get_sync) without each caller opening its own
+connections. Requests are limited per host, time out, and are retried with jittered
+exponential backoff on connection errors, 429s and 5xxs.
+"""
+
+retry_statuses = {429, 500, 502, 503, 504}
+
+http_requests = counter("http_client_requests_total", "Outgoing HTTP attempts by host and status (or error)", ("host", "status"))
+http_seconds = histogram("http_client_request_duration_seconds", "Outgoing HTTP attempt latency", ("host",))
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HttpClient:
+    def __init__(self,
+                 max_connections: int = 20,
+                 per_host_limit: int = 4,
+                 timeout: float = 10.0,
+                 retries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 8.0,
+                 http2: Optional[bool] = None,
+                 headers: Optional[dict[str, str]] = None):
+        self.per_host_limit = per_host_limit
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="http-client", daemon=True)
+        self._thread.start()
+
+        async def create_client() -> httpx.AsyncClient:
+            return httpx.AsyncClient(
+                http2=_http2_available() if http2 is None else http2,
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                headers=headers,
+                follow_redirects=True,
+            )
+
+        self._client = asyncio.run_coroutine_threadsafe(create_client(), self._loop).result()
+        # Only touched from the client's own loop
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # Full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        host = urlsplit(url).netloc
+        slots = self._host_slots.setdefault(host, asyncio.Semaphore(self.per_host_limit))
+
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            try:
+                async with slots:
+                    start = time.perf_counter()
+                    try:
+                        resp = await self._client.request(method, url, **kwargs)
+                    except httpx.TransportError:
+                        http_requests.inc(host=host, status="error")
+                        raise
+                    finally:
+                        http_seconds.observe(time.perf_counter() - start, host=host)
+                http_requests.inc(host=host, status=str(resp.status_code))
+                if resp.status_code not in retry_statuses or attempt == self.retries:
+                    return resp
+                retry_after = resp.headers.get("retry-after")
+                log(f"{method} {url} returned {resp.status_code}, retrying")
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    raise
+                log(f"{method} {url} raised {e!r}, retrying")
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        future = asyncio.run_coroutine_threadsafe(self._request(method, url, **kwargs), self._loop)
+        return await asyncio.wrap_future(future)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    def request_sync(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Blocking variant for worker threads. Must not be called from the client's own loop."""
+        return asyncio.run_coroutine_threadsafe(self._request(method, url, **kwargs), self._loop).result()
+
+    def get_sync(self, url: str, **kwargs) -> httpx.Response:
+        return self.request_sync("GET", url, **kwargs)
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+_http_client: Optional[HttpClient] = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Process-wide client, configured from the environment."""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = HttpClient(
+                max_connections=int(os.environ.get("HTTP_MAX_CONNECTIONS", 20)),
+                per_host_limit=int(os.environ.get("HTTP_PER_HOST_LIMIT", 4)),
+                timeout=float(os.environ.get("HTTP_TIMEOUT_SECONDS", 10)),
+                retries=int(os.environ.get("HTTP_RETRIES", 3)),
+                headers={"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"},
+            )
+        return _http_client
+
+
+def close_http_client() -> None:
+    global _http_client
+    with _http_client_lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
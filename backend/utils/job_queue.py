@@ -0,0 +1,255 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+log = print
+
+default_queue_path = Path(__file__).resolve().parent.parent / ".cache" / "jobs.sqlite3"
+
+"""
+Local, SQLite-backed job queue for long-running searches, so no external broker is
+needed. The web process enqueues jobs and reads their status; workers (see worker.py)
+claim queued jobs, stream partial results into them as they go, and record the final
+result or error. Jobs whose worker stops heartbeating are put back on the queue.
+
+Every claim bumps the job's attempts, which doubles as the claim's token: a worker's
+writes only apply while the job is running under its attempt, so a slow worker whose
+job was requeued and claimed again can't overwrite or duplicate the new run's results.
+"""
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    payload: dict[str, Any]
+    status: str
+    partial_results: list[Any] = field(default_factory=list)
+    result: Any = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: float = 0.0
+    updated_at: float = 0.0
+
+
+class JobQueue:
+    def __init__(self, path: str | Path = default_queue_path, max_attempts: int = 3):
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Several processes share the file, so wait on locks rather than failing
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                partial_results TEXT NOT NULL DEFAULT '[]',
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at)")
+        self._conn.commit()
+
+    def enqueue(self, kind: str, payload: dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), QUEUED, now, now),
+            )
+            self._conn.commit()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, payload, status, partial_results, result, error, attempts, created_at, updated_at "
+                "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else _row_job(row)
+
+    def claim(self, kinds: list[str]) -> Optional[Job]:
+        """Atomically move the oldest queued job of one of the given kinds to running."""
+        placeholders = ", ".join("?" for _ in kinds)
+        with self._lock:
+            row = self._conn.execute(f"""
+                UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ?
+                WHERE id = (
+                    SELECT id FROM jobs WHERE status = ? AND kind IN ({placeholders})
+                    ORDER BY created_at LIMIT 1
+                )
+                RETURNING id, kind, payload, status, partial_results, result, error, attempts, created_at, updated_at
+            """, (RUNNING, time.time(), QUEUED, *kinds)).fetchone()
+            self._conn.commit()
+        return None if row is None else _row_job(row)
+
+    def _update_claimed(self, job_id: str, attempt: int, assignments: str = "", params: tuple = ()) -> bool:
+        """Apply assignments if the job is still running under this claim; False if the claim was lost."""
+        with self._lock:
+            updated = self._conn.execute(
+                f"UPDATE jobs SET {assignments + ', ' if assignments else ''}updated_at = ? "
+                "WHERE id = ? AND attempts = ? AND status = ?",
+                (*params, time.time(), job_id, attempt, RUNNING)).rowcount
+            self._conn.commit()
+        return updated > 0
+
+    def append_partial(self, job_id: str, attempt: int, item: Any, replace_key: Optional[str] = None) -> bool:
+        """
+        Append item to the job's partial results. With replace_key, an earlier item with the
+        same value for that key is removed first, so an updated item replaces its stale copy.
+        """
+        if replace_key is None:
+            return self._update_claimed(job_id, attempt, "partial_results = json_insert(partial_results, '$[#]', json(?))",
+                                        (json.dumps(item),))
+        path = f"$.{replace_key}"
+        return self._update_claimed(job_id, attempt, """
+            partial_results = json_insert(
+                (SELECT json_group_array(json(value)) FROM json_each(partial_results)
+                 WHERE json_extract(value, ?) IS NOT json_extract(json(?), ?)),
+                '$[#]', json(?))
+        """, (path, json.dumps(item), path, json.dumps(item)))
+
+    def heartbeat(self, job_id: str, attempt: int) -> bool:
+        return self._update_claimed(job_id, attempt)
+
+    def complete(self, job_id: str, attempt: int, result: Any) -> bool:
+        return self._update_claimed(job_id, attempt, "status = ?, result = ?", (DONE, json.dumps(result)))
+
+    def fail(self, job_id: str, attempt: int, error: str) -> bool:
+        return self._update_claimed(job_id, attempt, "status = ?, error = ?", (FAILED, error))
+
+    def requeue_stale(self, stale_after: float) -> int:
+        """Put running jobs with no heartbeat for stale_after seconds back on the queue (or fail them)."""
+        cutoff = time.time() - stale_after
+        with self._lock:
+            failed = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = 'Worker died too many times' WHERE status = ? AND updated_at < ? AND attempts >= ?",
+                (FAILED, RUNNING, cutoff, self.max_attempts)).rowcount
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = ?, partial_results = '[]' WHERE status = ? AND updated_at < ?",
+                (QUEUED, RUNNING, cutoff)).rowcount
+            self._conn.commit()
+        if failed or requeued:
+            log(f"Requeued {requeued} and failed {failed} stale jobs")
+        return requeued
+
+
+def _row_job(row: tuple) -> Job:
+    job_id, kind, payload, status, partial_results, result, error, attempts, created_at, updated_at = row
+    return Job(
+        id=job_id,
+        kind=kind,
+        payload=json.loads(payload),
+        status=status,
+        partial_results=json.loads(partial_results),
+        result=None if result is None else json.loads(result),
+        error=error,
+        attempts=attempts,
+        created_at=created_at,
+        updated_at=updated_at,
+    )
+
+
+# handler(payload, report_partial) -> result, where report_partial(item, replace_key=None)
+JobHandler = Callable[[dict[str, Any], Callable[[Any], None]], Any]
+
+
+class JobWorkerPool:
+    """Threads that claim and run jobs until stopped."""
+
+    def __init__(self,
+                 queue: JobQueue,
+                 handlers: dict[str, JobHandler],
+                 concurrency: int = 2,
+                 poll_interval: float = 0.5,
+                 heartbeat_interval: float = 10.0,
+                 stale_after: float = 120.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def _run_job(self, job: Job) -> None:
+        log(f"Running {job.kind} job {job.id} (attempt {job.attempts})")
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(self.heartbeat_interval):
+                self.queue.heartbeat(job.id, job.attempts)
+
+        heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+        heartbeat_thread.start()
+        try:
+            result = self.handlers[job.kind](
+                job.payload,
+                lambda item, replace_key=None: self.queue.append_partial(job.id, job.attempts, item, replace_key))
+            if not self.queue.complete(job.id, job.attempts, result):
+                log(f"Job {job.id} was requeued while attempt {job.attempts} ran, dropping its result")
+        except Exception as e:
+            log(f"Job {job.id} failed: {e}")
+            self.queue.fail(job.id, job.attempts, str(e))
+        finally:
+            done.set()
+            heartbeat_thread.join()
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.queue.requeue_stale(self.stale_after)
+                job = self.queue.claim(list(self.handlers))
+            except sqlite3.Error as e:
+                log(f"Job queue error: {e}")
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            self._run_job(job)
+
+    def start(self) -> None:
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide queue, configured from the environment."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(os.environ.get("JOB_QUEUE_PATH", default_queue_path))
+        return _job_queue
@@ -0,0 +1,316 @@
+from anthropic import Anthropic, AsyncAnthropic
+from anthropic.types import Message
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional
+import asyncio
+import json
+import os
+import threading
+import time
+
+from utils.llm_cache import get_llm_cache
+from utils.metrics import counter, histogram
+from utils.models import min_cacheable_tokens
+from utils.rate_limiter import estimate_tokens, get_rate_limiter, is_rate_limit_error, retry_after_seconds
+
+"""
+Single entry point for Anthropic calls made by the controllers.
+
+Responses are served from the shared on-disk cache when the call is deterministic
+(temperature 0) or when the caller opts in with cache=True. cache_salt lets callers
+that deliberately sample several answers for the same prompt keep them apart.
+
+Calls that reach the API go through the process-wide rate limiter, and are retried
+(after the limiter's back-off) when they hit a 429.
+
+Prompts that are sent once per candidate (paper or patent) put their shared part, the
+instructions and the invention description, in a cached_system() prefix so the
+provider's prompt cache serves it after the first call; only the candidate goes in the
+user message.
+
+Token usage and cache hits are added up in llm_usage, and per scope with track_usage().
+"""
+
+rate_limit_retries = 3
+
+# "anthropic" or "local" (the stand-in in utils/local_llm.py)
+llm_client_backend = os.environ.get("LLM_CLIENT", "anthropic")
+prompt_caching_enabled = os.environ.get("LLM_PROMPT_CACHE", "true").lower() in ("1", "true", "yes")
+
+llm_requests = counter("llm_requests_total", "LLM API calls by outcome (ok, rate_limited, error)", ("model", "outcome"))
+llm_seconds = histogram("llm_request_duration_seconds", "LLM API call latency", ("model",))
+llm_tokens = counter("llm_tokens_total", "LLM tokens by type (input, output, cache_read, cache_creation)", ("model", "type"))
+llm_response_cache = counter("llm_response_cache_requests_total", "Cacheable LLM calls by on-disk cache result", ("result",))
+
+
+@dataclass
+class LLMUsage:
+    requests: int = 0           # calls that reached the API
+    cached_responses: int = 0   # calls served from the on-disk response cache
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    prompt_cache_hits: int = 0  # API calls that read part of their prompt from the prompt cache
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def record(self, usage: Any) -> None:
+        """Add the usage of one API response (a Usage object or the equivalent dict)."""
+        def tokens(name: str) -> int:
+            value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+            return value or 0
+
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += tokens("input_tokens")
+            self.output_tokens += tokens("output_tokens")
+            self.cache_creation_input_tokens += tokens("cache_creation_input_tokens")
+            self.cache_read_input_tokens += tokens("cache_read_input_tokens")
+            if tokens("cache_read_input_tokens"):
+                self.prompt_cache_hits += 1
+
+    def record_cached(self) -> None:
+        with self._lock:
+            self.cached_responses += 1
+
+    @property
+    def prompt_cache_hit_rate(self) -> float:
+        return self.prompt_cache_hits / self.requests if self.requests else 0.0
+
+    @property
+    def cached_token_fraction(self) -> float:
+        total = self.input_tokens + self.cache_creation_input_tokens + self.cache_read_input_tokens
+        return self.cache_read_input_tokens / total if total else 0.0
+
+    def to_dict(self) -> dict[str, int]:
+        with self._lock:
+            return {name: getattr(self, name) for name in self.__dataclass_fields__}
+
+
+# Process-wide totals
+llm_usage = LLMUsage()
+
+# Additional per-scope totals, e.g. per eval case, see track_usage
+current_usage: ContextVar[Optional[LLMUsage]] = ContextVar("llm_usage", default=None)
+
+
+@contextmanager
+def track_usage() -> Iterator[LLMUsage]:
+    """Count the LLM usage of everything run in this context (and tasks/threads copying it)."""
+    usage = LLMUsage()
+    token = current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        current_usage.reset(token)
+
+
+def _usages(usage: Optional[LLMUsage]) -> list[LLMUsage]:
+    usage = usage or current_usage.get()
+    return [llm_usage] if usage is None else [llm_usage, usage]
+
+
+def cached_system(*blocks: str, model: Optional[str] = None) -> list[dict[str, Any]]:
+    """
+    System prompt made of text blocks, with a cache breakpoint after the last one so the
+    whole prefix can be served from the provider's prompt cache. The API ignores the
+    breakpoint when the prefix is shorter than the model's minimum cacheable length;
+    given the model, the breakpoint is left out in that case.
+    """
+    system = [{"type": "text", "text": block} for block in blocks]
+    if model is not None and estimate_tokens("".join(blocks)) < min_cacheable_tokens(model):
+        return system
+    if prompt_caching_enabled and system:
+        system[-1]["cache_control"] = {"type": "ephemeral"}
+    return system
+
+
+def new_client():
+    if llm_client_backend == "local":
+        from utils.local_llm import LocalAnthropic
+        return LocalAnthropic()
+    return Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+
+
+def new_async_client():
+    if llm_client_backend == "local":
+        from utils.local_llm import AsyncLocalAnthropic
+        return AsyncLocalAnthropic()
+    return AsyncAnthropic()
+
+
+_client = None
+_async_client = None
+_clients_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client, shared by every search (and its worker threads)."""
+    global _client
+    with _clients_lock:
+        if _client is None:
+            _client = new_client()
+        return _client
+
+
+def get_async_client():
+    """Process-wide async client, see get_client."""
+    global _async_client
+    with _clients_lock:
+        if _async_client is None:
+            _async_client = new_async_client()
+        return _async_client
+
+
+async def close_clients() -> None:
+    global _client, _async_client
+    with _clients_lock:
+        client, async_client = _client, _async_client
+        _client = _async_client = None
+    # The local stand-ins hold no connections
+    if isinstance(client, Anthropic):
+        client.close()
+    if isinstance(async_client, AsyncAnthropic):
+        await async_client.close()
+
+
+def _should_cache(cache: Optional[bool], kwargs: dict[str, Any]) -> bool:
+    if cache is not None:
+        return cache
+    return kwargs.get("temperature") == 0
+
+
+def _cache_key(client, kwargs: dict[str, Any], cache_salt: Any) -> str:
+    request = dict(kwargs)
+    if cache_salt is not None:
+        request["cache_salt"] = cache_salt
+    # Keep stand-in responses apart from real ones
+    if not isinstance(client, (Anthropic, AsyncAnthropic)):
+        request["client"] = type(client).__name__
+    return get_llm_cache().make_key(request)
+
+
+def _estimated_tokens(kwargs: dict[str, Any]) -> int:
+    prompt = json.dumps([kwargs.get("system"), kwargs.get("messages")], default=str)
+    return estimate_tokens(prompt)
+
+
+def _actual_tokens(message: Message) -> Optional[int]:
+    usage = getattr(message, "usage", None)
+    return getattr(usage, "input_tokens", None)
+
+
+def _record_response(model: str, seconds: float, message: Message, usage: Optional[LLMUsage]) -> None:
+    llm_requests.inc(model=model, outcome="ok")
+    llm_seconds.observe(seconds, model=model)
+    if message.usage is not None:
+        for kind in ("input", "output", "cache_read_input", "cache_creation_input"):
+            llm_tokens.inc(getattr(message.usage, f"{kind}_tokens", None) or 0,
+                           model=model, type=kind.removesuffix("_input"))
+    for totals in _usages(usage):
+        totals.record(message.usage)
+
+
+def _record_error(model: str, seconds: float, rate_limited: bool) -> None:
+    llm_requests.inc(model=model, outcome="rate_limited" if rate_limited else "error")
+    llm_seconds.observe(seconds, model=model)
+
+
+def _call(client, priority: Optional[int], usage: Optional[LLMUsage], kwargs: dict[str, Any]) -> Message:
+    limiter = get_rate_limiter()
+    for attempt in range(rate_limit_retries + 1):
+        permit = limiter.acquire(_estimated_tokens(kwargs), priority)
+        start = time.perf_counter()
+        try:
+            message = client.messages.create(**kwargs)
+        except Exception as e:
+            rate_limited = is_rate_limit_error(e)
+            _record_error(kwargs["model"], time.perf_counter() - start, rate_limited)
+            limiter.release(permit, rate_limited=rate_limited, retry_after=retry_after_seconds(e))
+            if not rate_limited or attempt == rate_limit_retries:
+                raise
+            continue
+        except BaseException:
+            # Cancelled (e.g. a streaming client disconnected) or interrupted
+            limiter.release(permit)
+            raise
+        limiter.release(permit, actual_tokens=_actual_tokens(message), completed=True)
+        _record_response(kwargs["model"], time.perf_counter() - start, message, usage)
+        return message
+
+
+async def _acall(client, priority: Optional[int], usage: Optional[LLMUsage], kwargs: dict[str, Any]) -> Message:
+    limiter = get_rate_limiter()
+    for attempt in range(rate_limit_retries + 1):
+        permit = await limiter.aacquire(_estimated_tokens(kwargs), priority)
+        start = time.perf_counter()
+        try:
+            message = await client.messages.create(**kwargs)
+        except Exception as e:
+            rate_limited = is_rate_limit_error(e)
+            _record_error(kwargs["model"], time.perf_counter() - start, rate_limited)
+            limiter.release(permit, rate_limited=rate_limited, retry_after=retry_after_seconds(e))
+            if not rate_limited or attempt == rate_limit_retries:
+                raise
+            continue
+        except BaseException:
+            # Cancelled (e.g. a streaming client disconnected) or interrupted
+            limiter.release(permit)
+            raise
+        limiter.release(permit, actual_tokens=_actual_tokens(message), completed=True)
+        _record_response(kwargs["model"], time.perf_counter() - start, message, usage)
+        return message
+
+
+def create_message(client,
+                   cache: Optional[bool] = None,
+                   cache_salt: Any = None,
+                   priority: Optional[int] = None,
+                   usage: Optional[LLMUsage] = None,
+                   **kwargs) -> Message:
+    """usage defaults to the one tracked by the current context, if any."""
+    if not _should_cache(cache, kwargs):
+        return _call(client, priority, usage, kwargs)
+
+    llm_cache = get_llm_cache()
+    key = _cache_key(client, kwargs, cache_salt)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        llm_response_cache.inc(result="hit")
+        for totals in _usages(usage):
+            totals.record_cached()
+        return Message.model_validate_json(cached)
+    llm_response_cache.inc(result="miss")
+
+    message = _call(client, priority, usage, kwargs)
+    llm_cache.put(key, message.model_dump_json())
+    return message
+
+
+async def acreate_message(client,
+                          cache: Optional[bool] = None,
+                          cache_salt: Any = None,
+                          priority: Optional[int] = None,
+                          usage: Optional[LLMUsage] = None,
+                          **kwargs) -> Message:
+    if not _should_cache(cache, kwargs):
+        return await _acall(client, priority, usage, kwargs)
+
+    # The cache is SQLite on disk (and put() may evict), keep it off the event loop
+    llm_cache = await asyncio.to_thread(get_llm_cache)
+    key = _cache_key(client, kwargs, cache_salt)
+    cached = await asyncio.to_thread(llm_cache.get, key)
+    if cached is not None:
+        llm_response_cache.inc(result="hit")
+        for totals in _usages(usage):
+            totals.record_cached()
+        return Message.model_validate_json(cached)
+    llm_response_cache.inc(result="miss")
+
+    message = await _acall(client, priority, usage, kwargs)
+    await asyncio.to_thread(llm_cache.put, key, message.model_dump_json())
+    return message
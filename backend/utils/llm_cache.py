@@ -0,0 +1,139 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+default_cache_path = Path(__file__).resolve().parent.parent / ".cache" / "llm_cache.sqlite3"
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class LLMCache:
+    """
+    Content-addressed, on-disk cache of LLM responses.
+
+    Entries are keyed on a hash of the full request (model, system prompt, messages,
+    temperature, max_tokens, ...). The cache is bounded by total payload size and
+    evicts least recently used entries first; entries older than ttl_seconds are
+    treated as misses.
+    """
+
+    def __init__(self,
+                 path: str | Path = default_cache_path,
+                 max_bytes: int = 256 * 1024 * 1024,
+                 ttl_seconds: Optional[float] = 30 * 24 * 3600,
+                 bypass: bool = False):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.bypass = bypass
+        self.stats = CacheStats()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(request: dict[str, Any]) -> str:
+        canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if self.bypass:
+            return None
+
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats.hits += 1
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        if self.bypass:
+            return
+
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_bytes:
+            return
+
+        # Drop least recently used entries until we're back under budget
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.stats.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+
+_llm_cache: Optional[LLMCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    """Process-wide cache shared by both controllers, configured from the environment."""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMCache(
+                path=os.environ.get("LLM_CACHE_PATH", default_cache_path),
+                max_bytes=int(os.environ.get("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+                ttl_seconds=float(os.environ.get("LLM_CACHE_TTL_SECONDS", 30 * 24 * 3600)),
+                bypass=os.environ.get("LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes"),
+            )
+        return _llm_cache
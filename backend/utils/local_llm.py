@@ -0,0 +1,153 @@
+from anthropic.types import Message
+from typing import Any, Callable, Optional
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+from utils.llm import LLMUsage
+from utils.rate_limiter import estimate_tokens
+
+"""
+Local stand-in for the Anthropic client (LLM_CLIENT=local), for offline development
+and benchmarking. It answers through a responder function instead of the network, and
+emulates the provider's prompt caching so prefix reuse can be measured without
+spending tokens:
+
+- the prompt is the system blocks followed by the message content blocks, in order
+- a block with cache_control marks a cache breakpoint; the prefix up to the last
+  breakpoint is written to the cache if it is at least min_cacheable_tokens long
+- a later request whose prefix up to any of its breakpoints matches a live entry reads
+  those tokens from the cache, and the entry's ttl is refreshed
+
+The usage on each returned Message reports input_tokens, cache_creation_input_tokens
+and cache_read_input_tokens the same way the API does. latency (seconds) is added to
+every call to stand in for the network and model time.
+"""
+
+Responder = Callable[[dict[str, Any]], str]
+
+
+def default_responder(request: dict[str, Any]) -> str:
+    return "0.0"
+
+
+def _blocks(request: dict[str, Any]) -> list[dict[str, Any]]:
+    blocks = []
+    system = request.get("system")
+    if isinstance(system, str):
+        blocks.append({"type": "text", "text": system})
+    elif system:
+        blocks.extend(system)
+    for message in request.get("messages", []):
+        content = message["content"]
+        if isinstance(content, str):
+            blocks.append({"type": "text", "text": content, "role": message["role"]})
+        else:
+            blocks.extend({**block, "role": message["role"]} for block in content)
+    return blocks
+
+
+def _block_tokens(block: dict[str, Any]) -> int:
+    return estimate_tokens(block.get("text", ""))
+
+
+class PrefixCache:
+    def __init__(self, ttl_seconds: float = 300, min_cacheable_tokens: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.min_cacheable_tokens = min_cacheable_tokens
+        self.stats = LLMUsage()
+        self._entries: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(model: str, prefix: list[dict[str, Any]]) -> str:
+        payload = json.dumps([model, [{k: v for k, v in block.items() if k != "cache_control"} for block in prefix]],
+                             sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def usage(self, request: dict[str, Any]) -> dict[str, int]:
+        """Token accounting for one request, updating the cache as the API would."""
+        blocks = _blocks(request)
+        total = sum(_block_tokens(block) for block in blocks)
+        breakpoints = [i + 1 for i, block in enumerate(blocks) if block.get("cache_control")]
+        cache_read = cache_creation = 0
+        now = time.monotonic()
+
+        with self._lock:
+            for end in reversed(breakpoints):
+                key = self._key(request["model"], blocks[:end])
+                if self._entries.get(key, 0) > now:
+                    self._entries[key] = now + self.ttl_seconds
+                    cache_read = sum(_block_tokens(block) for block in blocks[:end])
+                    break
+            if breakpoints:
+                end = breakpoints[-1]
+                prefix_tokens = sum(_block_tokens(block) for block in blocks[:end])
+                if prefix_tokens > cache_read and prefix_tokens >= self.min_cacheable_tokens:
+                    self._entries[self._key(request["model"], blocks[:end])] = now + self.ttl_seconds
+                    cache_creation = prefix_tokens - cache_read
+
+        return {
+            "input_tokens": total - cache_read - cache_creation,
+            "cache_creation_input_tokens": cache_creation,
+            "cache_read_input_tokens": cache_read,
+        }
+
+
+class _Messages:
+    def __init__(self, owner: "LocalAnthropic"):
+        self._owner = owner
+
+    def create(self, **kwargs) -> Message:
+        time.sleep(self._owner.latency)
+        return self._owner._respond(kwargs)
+
+
+class _AsyncMessages:
+    def __init__(self, owner: "AsyncLocalAnthropic"):
+        self._owner = owner
+
+    async def create(self, **kwargs) -> Message:
+        await asyncio.sleep(self._owner.latency)
+        return self._owner._respond(kwargs)
+
+
+class LocalAnthropic:
+    """Drop-in for anthropic.Anthropic: client.messages.create(**kwargs) -> Message."""
+
+    def __init__(self,
+                 responder: Responder = default_responder,
+                 prefix_cache: Optional[PrefixCache] = None,
+                 latency: float = 0.0):
+        self.responder = responder
+        self.prefix_cache = prefix_cache or PrefixCache()
+        self.latency = latency
+        self.messages = _Messages(self)
+
+    def _respond(self, request: dict[str, Any]) -> Message:
+        text = self.responder(request)
+        usage = {**self.prefix_cache.usage(request), "output_tokens": estimate_tokens(text)}
+        self.prefix_cache.stats.record(usage)
+        return Message.model_validate({
+            "id": f"msg_local_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": request["model"],
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "usage": usage,
+        })
+
+
+class AsyncLocalAnthropic(LocalAnthropic):
+    """Drop-in for anthropic.AsyncAnthropic."""
+
+    def __init__(self,
+                 responder: Responder = default_responder,
+                 prefix_cache: Optional[PrefixCache] = None,
+                 latency: float = 0.0):
+        super().__init__(responder, prefix_cache, latency)
+        self.messages = _AsyncMessages(self)
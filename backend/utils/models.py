@@ -0,0 +1,53 @@
+from typing import List, Sequence
+import math
+import os
+
+"""
+claude-3-7-sonnet-20250219
+claude-3-5-sonnet-20240620
+claude-3-opus-20240229
+claude-3-5-haiku-20241022 --> cheapest
+
+Relevance scoring is a two-tier cascade: fast_model gives every candidate a bare score,
+then only a few are re-scored by strong_model with reasoning: the top
+cascade_top_fraction of the candidates, then the borderline ones (score inside
+cascade_band, where the UI's relevance label is least certain), up to
+cascade_max_fraction of the candidates in total. The re-score round runs after the
+fast one, so it has to stay small to be cheaper than scoring everything with
+strong_model.
+"""
+fast_model = os.environ.get("LLM_FAST_MODEL", "claude-3-5-haiku-20241022")
+strong_model = os.environ.get("LLM_STRONG_MODEL", "claude-3-7-sonnet-20250219")
+
+cascade_enabled = os.environ.get("LLM_CASCADE", "true").lower() in ("1", "true", "yes")
+cascade_top_fraction = float(os.environ.get("LLM_CASCADE_TOP_FRACTION", 0.2))
+cascade_max_fraction = float(os.environ.get("LLM_CASCADE_MAX_FRACTION", 0.3))
+cascade_band = (0.4, 0.6)
+
+# Output token budgets per call type
+score_max_tokens = 16             # a bare float
+reasoned_score_max_tokens = 400   # {"relevance_score", "reasoning"} JSON
+summary_max_tokens = 400          # 100 words
+query_max_tokens = 256            # one search query / rephrasing
+
+
+def min_cacheable_tokens(model: str) -> int:
+    """Shortest prompt prefix the provider will cache for this model."""
+    return 2048 if "haiku" in model else 1024
+
+
+def select_for_rescoring(scores: Sequence[float],
+                         top_fraction: float = cascade_top_fraction,
+                         max_fraction: float = cascade_max_fraction) -> List[int]:
+    """
+    Indices of the candidates to re-score: the top top_fraction by score, then the
+    borderline ones closest to the middle of cascade_band, at most max_fraction of all
+    candidates in total (e.g. 2 top and 1 borderline of 10). Ties keep input order.
+    """
+    order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+    top_k = math.ceil(len(scores) * top_fraction)
+    max_rescored = max(top_k, math.ceil(len(scores) * max_fraction))
+    low, high = cascade_band
+    borderline = sorted((i for i in order[top_k:] if low <= scores[i] <= high),
+                        key=lambda i: abs(scores[i] - (low + high) / 2))
+    return (order[:top_k] + borderline)[:max_rescored]
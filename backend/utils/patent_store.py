@@ -0,0 +1,179 @@
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+import ast
+import csv
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+default_store_path = Path(__file__).resolve().parent.parent / ".cache" / "patent_store.sqlite3"
+
+
+def normalize_patent_id(patent_id: str) -> str:
+    """
+    Canonical form used as the store key: uppercase, no separators, US prefix for bare
+    numbers and no trailing kind code, so "9,691,429", "us9691429" and "US9691429B2"
+    all map to "US9691429".
+    """
+    normalized = re.sub(r"[\s,\-/]", "", str(patent_id)).upper()
+    if normalized[:1].isdigit():
+        normalized = "US" + normalized
+    match = re.fullmatch(r"([A-Z]{2}\d+)[A-Z]\d?", normalized)
+    if match:
+        normalized = match.group(1)
+    return normalized
+
+
+@dataclass
+class PatentDocument:
+    id: str
+    title: Optional[str]
+    abstract: Optional[str]
+    claims: Optional[str]
+    summary: Optional[str] = None
+    fetched_at: float = 0.0
+
+    @property
+    def props(self) -> dict[str, Optional[str]]:
+        """Same shape GPatentEngine.get_patent_claims returns."""
+        return {
+            "title": self.title,
+            "abstract": self.abstract,
+            "claims": self.claims,
+        }
+
+
+class PatentStore:
+    """
+    Persistent store of scraped patent documents (and our generated summaries), keyed
+    by normalized patent number. Documents older than ttl_seconds are considered stale
+    and get refetched.
+    """
+
+    def __init__(self, path: str | Path = default_store_path, ttl_seconds: Optional[float] = 90 * 24 * 3600):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS patents (
+                id TEXT PRIMARY KEY,
+                title TEXT,
+                abstract TEXT,
+                claims TEXT,
+                summary TEXT,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, patent_id: str) -> Optional[PatentDocument]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, title, abstract, claims, summary, fetched_at FROM patents WHERE id = ?",
+                (normalize_patent_id(patent_id),),
+            ).fetchone()
+        if row is None:
+            return None
+
+        document = PatentDocument(*row)
+        if self.ttl_seconds is not None and time.time() - document.fetched_at > self.ttl_seconds:
+            return None
+        return document
+
+    def put(self, patent_id: str, props: dict[str, Optional[str]], summary: Optional[str] = None) -> PatentDocument:
+        document = PatentDocument(
+            id=normalize_patent_id(patent_id),
+            title=props.get("title"),
+            abstract=props.get("abstract"),
+            claims=props.get("claims"),
+            summary=summary,
+            fetched_at=time.time(),
+        )
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO patents (id, title, abstract, claims, summary, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+                tuple(asdict(document).values()),
+            )
+            self._conn.commit()
+        return document
+
+    def iter_documents(self) -> Iterator[PatentDocument]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, title, abstract, claims, summary, fetched_at FROM patents").fetchall()
+        for row in rows:
+            yield PatentDocument(*row)
+
+    def set_summary(self, patent_id: str, summary: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE patents SET summary = ? WHERE id = ?", (summary, normalize_patent_id(patent_id)))
+            self._conn.commit()
+
+    def get_or_fetch(self, patent_id: str, fetch_fn: Callable[[str], dict[str, Optional[str]]], refresh: bool = False) -> PatentDocument:
+        """Return the stored document, only calling fetch_fn when it is missing, stale or refresh is set."""
+        document = None if refresh else self.get(patent_id)
+        if document is None:
+            document = self.put(patent_id, fetch_fn(patent_id))
+        return document
+
+    def prewarm(self, patent_ids: Iterable[str], fetch_fn: Callable[[str], dict[str, Optional[str]]]) -> int:
+        """Fetch any of patent_ids not already stored. Returns the number of documents fetched."""
+        fetched = 0
+        for patent_id in dict.fromkeys(normalize_patent_id(p) for p in patent_ids):
+            if self.get(patent_id) is not None:
+                continue
+            try:
+                self.put(patent_id, fetch_fn(patent_id))
+                fetched += 1
+            except Exception as e:
+                print(f"Failed to prewarm {patent_id}: {e}")
+        return fetched
+
+
+_patent_store: Optional[PatentStore] = None
+_patent_store_lock = threading.Lock()
+
+
+def get_patent_store() -> PatentStore:
+    """Process-wide store, configured from the environment."""
+    global _patent_store
+    with _patent_store_lock:
+        if _patent_store is None:
+            _patent_store = PatentStore(
+                path=os.environ.get("PATENT_STORE_PATH", default_store_path),
+                ttl_seconds=float(os.environ.get("PATENT_STORE_TTL_SECONDS", 90 * 24 * 3600)),
+            )
+        return _patent_store
+
+
+def patent_ids_from_eval_csv(csv_path: str | Path) -> list[str]:
+    """Collect ground truth patent IDs from an eval dataset (e.g. eval/datasets/patent_evals.csv)."""
+    patent_ids = []
+    with open(csv_path, newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("type") != "patent":
+                continue
+            ground_truth = ast.literal_eval(row["ground_truth"])
+            patent_ids.extend(str(patent_id) for patent_id in ground_truth)
+    return patent_ids
+
+
+# Pre-warm the store from eval datasets or plain ID lists:
+#   python -m utils.patent_store ../eval/datasets/patent_evals.csv
+#   python -m utils.patent_store US9691429 US5934226
+if __name__ == "__main__":
+    from controllers.patent_controller import GPatentEngine
+
+    patent_ids = []
+    for arg in sys.argv[1:]:
+        patent_ids.extend(patent_ids_from_eval_csv(arg) if arg.endswith(".csv") else [arg])
+
+    fetched = get_patent_store().prewarm(patent_ids, GPatentEngine.get_patent_claims)
+    print(f"Fetched {fetched} of {len(set(map(normalize_patent_id, patent_ids)))} patents")
@@ -0,0 +1,71 @@
+from typing import List, Optional, Sequence
+import numpy as np
+import os
+import re
+import zlib
+
+"""
+Cheap, CPU-only relevance pre-ranking.
+
+Candidates and the description are embedded as hashed word unigram + bigram TF-IDF
+vectors and compared by cosine similarity, so obviously off-topic candidates can be
+dropped before any LLM scoring call is spent on them.
+"""
+
+n_features = 2 ** 14
+
+# Defaults used by the controllers
+prerank_min_score = float(os.environ.get("PRERANK_MIN_SCORE", 0.0))
+
+_token_pattern = re.compile(r"[a-z0-9]+")
+_stopwords = frozenset("""
+a an and are as at be by for from has have in into is it its of on or that the their this to
+using via was were which with wherein said such one more least thereof based system method
+""".split())
+
+
+def _features(text: str) -> List[int]:
+    tokens = [t for t in _token_pattern.findall(text.lower()) if t not in _stopwords]
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    # crc32 rather than hash() so buckets are stable across processes
+    return [zlib.crc32(gram.encode("utf-8")) % n_features for gram in grams]
+
+
+def tfidf_matrix(texts: Sequence[str]) -> np.ndarray:
+    """L2-normalized hashed TF-IDF rows, one per text."""
+    counts = np.zeros((len(texts), n_features), dtype=np.float32)
+    for row, text in enumerate(texts):
+        np.add.at(counts[row], _features(text), 1.0)
+
+    # Sublinear tf, smoothed idf over this set of texts
+    tf = np.log1p(counts, out=counts)
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log((1 + len(texts)) / (1 + df)).astype(np.float32) + 1.0
+    weights = tf * idf
+
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    return weights / np.maximum(norms, 1e-12)
+
+
+def similarity_scores(description: str, texts: Sequence[str]) -> np.ndarray:
+    """Cosine similarity of each text to the description, in [0, 1]."""
+    if not texts:
+        return np.zeros(0, dtype=np.float32)
+    matrix = tfidf_matrix([description, *texts])
+    return matrix[1:] @ matrix[0]
+
+
+def prerank(description: str,
+            texts: Sequence[str],
+            top_k: Optional[int] = None,
+            min_score: float = prerank_min_score) -> List[int]:
+    """
+    Indices of the texts worth sending to the LLM, most similar first: at most top_k of
+    them, and only those scoring at least min_score.
+    """
+    scores = similarity_scores(description, texts)
+    order = np.argsort(-scores, kind="stable")
+    order = order[scores[order] >= min_score]
+    if top_k is not None:
+        order = order[:top_k]
+    return order.tolist()
@@ -0,0 +1,239 @@
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterator, Optional
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from utils.metrics import gauge
+
+log = print
+
+"""
+Process-wide limiter for LLM calls.
+
+Every call site takes a permit before calling the API. A permit needs a free
+concurrency slot plus room in two token buckets: requests per minute and estimated
+tokens per minute. Waiters are served strictly by priority, so interactive searches
+jump ahead of batch/eval work.
+
+Concurrency adapts AIMD-style: a 429 halves it and pauses everyone until the
+retry-after has passed, and a run of completed calls grows it back by one. Other
+errors and cancelled calls leave it as it is.
+
+Waiting is done by polling so the same limiter works from worker threads and from any
+event loop.
+"""
+
+INTERACTIVE = 0
+BATCH = 1
+
+# Priority used when a call site doesn't pass one, e.g. set to BATCH by the eval runner
+current_priority: ContextVar[int] = ContextVar("llm_priority", default=INTERACTIVE)
+
+_poll_interval = 0.05
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until amount is available (0 if it is now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """Credit back (positive) or debit (negative) once the real usage is known."""
+        self.level = min(self.capacity, self.level + amount)
+
+
+@dataclass
+class Permit:
+    estimated_tokens: int
+    priority: int
+
+
+class RateLimiter:
+    def __init__(self,
+                 requests_per_minute: float = 50,
+                 tokens_per_minute: float = 80000,
+                 max_concurrency: int = 16,
+                 min_concurrency: int = 1,
+                 increase_after: int = 10):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.increase_after = increase_after
+
+        self.concurrency = max_concurrency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.rate_limited_count = 0
+        self._successes = 0
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._waiting: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _enqueue(self, priority: int) -> tuple[int, int]:
+        ticket = (priority, next(self._seq))
+        with self._lock:
+            heapq.heappush(self._waiting, ticket)
+        return ticket
+
+    def _try_acquire(self, ticket: tuple[int, int], estimated_tokens: int) -> Optional[float]:
+        """None if the permit was granted, otherwise how long to wait before trying again."""
+        with self._lock:
+            if self._waiting[0] != ticket:
+                return _poll_interval
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight >= self.concurrency:
+                return _poll_interval
+            delay = max(self._requests.delay(1, now), self._tokens.delay(estimated_tokens, now))
+            if delay > 0:
+                return delay
+
+            heapq.heappop(self._waiting)
+            self._requests.take(1)
+            self._tokens.take(estimated_tokens)
+            self.in_flight += 1
+            return None
+
+    def _abandon(self, ticket: tuple[int, int]) -> None:
+        with self._lock:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+
+    def acquire(self, estimated_tokens: int = 1, priority: Optional[int] = None) -> Permit:
+        priority = current_priority.get() if priority is None else priority
+        ticket = self._enqueue(priority)
+        try:
+            while (delay := self._try_acquire(ticket, estimated_tokens)) is not None:
+                time.sleep(min(delay, _poll_interval))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        return Permit(estimated_tokens, priority)
+
+    async def aacquire(self, estimated_tokens: int = 1, priority: Optional[int] = None) -> Permit:
+        priority = current_priority.get() if priority is None else priority
+        ticket = self._enqueue(priority)
+        try:
+            while (delay := self._try_acquire(ticket, estimated_tokens)) is not None:
+                await asyncio.sleep(min(delay, _poll_interval))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        return Permit(estimated_tokens, priority)
+
+    def release(self,
+                permit: Permit,
+                rate_limited: bool = False,
+                retry_after: Optional[float] = None,
+                actual_tokens: Optional[int] = None,
+                completed: bool = False) -> None:
+        """completed is only set for a call that got its response, which counts towards growing concurrency."""
+        with self._lock:
+            self.in_flight -= 1
+            if actual_tokens is not None:
+                self._tokens.adjust(permit.estimated_tokens - actual_tokens)
+
+            if rate_limited:
+                self.rate_limited_count += 1
+                self._successes = 0
+                self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+                self.paused_until = max(self.paused_until, time.monotonic() + (retry_after or 1.0))
+                log(f"LLM rate limited, concurrency now {self.concurrency}")
+            elif completed:
+                self._successes += 1
+                if self._successes >= self.increase_after and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self._successes = 0
+
+    def _release_after(self, permit: Permit, error: Optional[BaseException]) -> None:
+        if error is not None and is_rate_limit_error(error):
+            self.release(permit, rate_limited=True, retry_after=retry_after_seconds(error))
+        else:
+            self.release(permit, completed=error is None)
+
+    @contextmanager
+    def permit(self, estimated_tokens: int = 1, priority: Optional[int] = None) -> Iterator[Permit]:
+        permit = self.acquire(estimated_tokens, priority)
+        try:
+            yield permit
+        except BaseException as e:
+            self._release_after(permit, e)
+            raise
+        self._release_after(permit, None)
+
+    @asynccontextmanager
+    async def apermit(self, estimated_tokens: int = 1, priority: Optional[int] = None) -> AsyncIterator[Permit]:
+        permit = await self.aacquire(estimated_tokens, priority)
+        try:
+            yield permit
+        except BaseException as e:
+            self._release_after(permit, e)
+            raise
+        self._release_after(permit, None)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    # Covers anthropic.RateLimitError and litellm.RateLimitError
+    return getattr(error, "status_code", None) == 429
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+gauge("llm_in_flight", "LLM calls holding a rate limiter permit",
+      fn=lambda: _rate_limiter.in_flight if _rate_limiter else 0)
+gauge("llm_concurrency_limit", "Current adaptive LLM concurrency limit",
+      fn=lambda: _rate_limiter.concurrency if _rate_limiter else 0)
+gauge("llm_waiting", "LLM calls waiting for a rate limiter permit",
+      fn=lambda: len(_rate_limiter._waiting) if _rate_limiter else 0)
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Process-wide limiter, configured from the environment."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(
+                requests_per_minute=float(os.environ.get("ANTHROPIC_RPM", 50)),
+                tokens_per_minute=float(os.environ.get("ANTHROPIC_TPM", 80000)),
+                max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", 16)),
+            )
+        return _rate_limiter
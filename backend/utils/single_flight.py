@@ -0,0 +1,51 @@
+from typing import Any, Awaitable, Callable, Hashable, Optional, TypeVar
+import asyncio
+import time
+
+T = TypeVar("T")
+
+"""
+Request coalescing: concurrent calls with the same key share one computation, and the
+result is kept for a short while so late arrivals get it too. Failures aren't kept.
+"""
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+class SingleFlight:
+    def __init__(self, ttl_seconds: float = 30.0):
+        self.ttl_seconds = ttl_seconds
+        self.coalesced = 0
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self._results: dict[Hashable, tuple[float, Any]] = {}
+
+    def _cached(self, key: Hashable) -> Optional[tuple[float, Any]]:
+        now = time.monotonic()
+        # Drop anything expired while we're here
+        for expired in [k for k, (expires_at, _) in self._results.items() if expires_at <= now]:
+            del self._results[expired]
+        return self._results.get(key)
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        cached = self._cached(key)
+        if cached is not None:
+            self.coalesced += 1
+            return cached[1]
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda finished: self._finish(key, finished))
+        else:
+            self.coalesced += 1
+
+        # Shielded so one caller disconnecting doesn't cancel the search for everyone else
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is None and self.ttl_seconds > 0:
+            self._results[key] = (time.monotonic() + self.ttl_seconds, task.result())
@@ -0,0 +1,120 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+import json
+import os
+import threading
+import time
+
+from utils.metrics import counter, gauge, histogram
+
+"""
+Per-stage tracing for the search pipelines.
+
+Pipeline code wraps each stage in stage("name"). Every run of a stage:
+- is observed in the search_stage_* Prometheus metrics,
+- is logged as a JSON span line tagged with the current request id (TRACE_SPANS),
+- is added to the StageTimings tracked for the current context, if any (track_timings).
+Stages that run once per candidate overlap, so StageTimings keeps both the summed time
+of all their runs and their wall-clock span from the first start to the last end.
+"""
+
+log = print
+
+trace_spans = os.environ.get("TRACE_SPANS", "true").lower() in ("1", "true", "yes")
+
+stage_seconds = histogram("search_stage_duration_seconds", "Time spent in each search pipeline stage", ("stage",))
+stage_in_flight = gauge("search_stage_in_flight", "Search pipeline stages currently running", ("stage",))
+stage_errors = counter("search_stage_errors_total", "Search pipeline stages that raised", ("stage",))
+
+
+@dataclass
+class StageStats:
+    count: int = 0
+    total_seconds: float = 0.0
+    first_start: float = 0.0
+    last_end: float = 0.0
+
+    @property
+    def wall_seconds(self) -> float:
+        return self.last_end - self.first_start
+
+    def to_dict(self) -> dict[str, float]:
+        return {"count": self.count, "total_seconds": self.total_seconds, "wall_seconds": self.wall_seconds}
+
+
+@dataclass
+class StageTimings:
+    stages: dict[str, StageStats] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def record(self, name: str, start: float, end: float) -> None:
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats(first_start=start, last_end=end)
+            stats.count += 1
+            stats.total_seconds += end - start
+            stats.first_start = min(stats.first_start, start)
+            stats.last_end = max(stats.last_end, end)
+
+    def to_dict(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in self.stages.items()}
+
+
+current_timings: ContextVar[Optional[StageTimings]] = ContextVar("stage_timings", default=None)
+
+# Set per API request by main.py
+current_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+@dataclass
+class Trace:
+    request_id: Optional[str] = None
+    timings: Optional[StageTimings] = None
+
+
+def current_trace() -> Trace:
+    """What stage() reads from the context, to hand to worker threads that don't inherit it."""
+    return Trace(current_request_id.get(), current_timings.get())
+
+
+@contextmanager
+def track_timings() -> Iterator[StageTimings]:
+    timings = StageTimings()
+    token = current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        current_timings.reset(token)
+
+
+@contextmanager
+def stage(name: str, trace: Optional[Trace] = None) -> Iterator[None]:
+    """
+    Time a pipeline stage. trace defaults to the current context's; code running in
+    worker threads that don't inherit it passes one captured with current_trace().
+    """
+    trace = trace or current_trace()
+    status = "ok"
+    stage_in_flight.inc(stage=name)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        stage_errors.inc(stage=name)
+        raise
+    finally:
+        end = time.perf_counter()
+        stage_in_flight.dec(stage=name)
+        stage_seconds.observe(end - start, stage=name)
+        if trace.timings is not None:
+            trace.timings.record(name, start, end)
+        if trace_spans:
+            log(json.dumps({"span": name, "request_id": trace.request_id,
+                            "duration_ms": round((end - start) * 1000, 1), "status": status}))
@@ -0,0 +1,313 @@
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Sequence
+import argparse
+import importlib
+import json
+import numpy as np
+import os
+import re
+import threading
+import time
+import zlib
+
+default_index_dir = Path(__file__).resolve().parent.parent / ".cache" / "vector_index"
+
+"""
+Memory-mapped dense vector index for semantic retrieval over abstracts (arXiv papers
+and stored patents).
+
+On-disk layout (one directory):
+    meta.json       dim, dtype, counts
+    vectors.bin     float16 or int8 matrix, rows grouped by IVF list, opened with np.memmap
+    scales.npy      per-row dequantization scale (int8 only)
+    centroids.npy   IVF centroids
+    offsets.npy     start row of each IVF list in vectors.bin
+    doc_ids.bin     "source:id" of each row as UTF-8, concatenated in row order
+    doc_offsets.npy n + 1 byte offsets of the doc ids in doc_ids.bin
+
+Queries probe the nprobe closest IVF lists and only read those rows, and since the
+matrix and doc ids are mmapped read-only every uvicorn worker shares the same page cache.
+
+The embedder is chosen at build time (VECTOR_INDEX_EMBEDDER, see load_embedder) and
+recorded in meta.json, so queries are embedded the same way. The default is a local,
+dependency-free one (hashed word and character trigram features, see hashed_embed),
+which only matches documents sharing words with the query; configure a real embedding
+model to find prior art that uses different vocabulary.
+
+Build with:
+    python -m utils.vector_index build
+"""
+
+EmbedFn = Callable[[Sequence[str]], np.ndarray]
+
+dim = 256
+
+# "fuse" merges semantic hits with keyword results, "only" skips keyword search and
+# "off" disables semantic retrieval. Has no effect until the index has been built.
+semantic_search_mode = os.environ.get("SEMANTIC_SEARCH", "fuse")
+_token_pattern = re.compile(r"[a-z0-9]+")
+
+
+def _hashed_grams(text: str) -> np.ndarray:
+    hashes = []
+    for token in _token_pattern.findall(text.lower()):
+        grams = [token] + [token[i:i + 3] for i in range(max(1, len(token) - 2))]
+        hashes.extend(zlib.crc32(gram.encode("utf-8")) for gram in grams)
+    return np.array(hashes, dtype=np.int64)
+
+
+def hashed_embed(texts: Sequence[str]) -> np.ndarray:
+    """
+    L2-normalized local embeddings, one row per text. Each word and character trigram
+    is hashed to a dimension and a sign, i.e. a sparse random projection of the
+    bag-of-grams vector.
+    """
+    embeddings = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        hashes = _hashed_grams(text)
+        if not len(hashes):
+            continue
+        signs = np.where((hashes >> 16) & 1, 1.0, -1.0).astype(np.float32)
+        np.add.at(embeddings[i], hashes % dim, signs)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def load_embedder(spec: str) -> EmbedFn:
+    """
+    The embed function named by spec:
+        hashed                          hashed_embed (default)
+        sentence-transformers:<model>   a sentence-transformers model, e.g. all-MiniLM-L6-v2
+        <module>:<function>             any function from a list of texts to a 2D float array
+    """
+    if spec == "hashed":
+        return hashed_embed
+    kind, _, name = spec.partition(":")
+    if not name:
+        raise ValueError(f"Unknown embedder {spec!r}, expected hashed, sentence-transformers:<model> or module:function")
+    if kind == "sentence-transformers":
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(name)
+        return lambda texts: model.encode(list(texts), convert_to_numpy=True)
+    return getattr(importlib.import_module(kind), name)
+
+
+def _embed(embed_fn: EmbedFn, texts: Sequence[str]) -> np.ndarray:
+    """L2-normalized float32 embeddings, whatever the embed function returns."""
+    embeddings = np.asarray(embed_fn(texts), dtype=np.float32)
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means, returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(len(vectors), 50 * k), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(k):
+            members = sample[assignment == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+
+def build_index(index_dir: str | Path,
+                docs: Iterable[tuple[str, str]],
+                embedder: str = "hashed",
+                dtype: str = "float16",
+                n_lists: Optional[int] = None,
+                batch_size: int = 1024) -> int:
+    """
+    Embed (doc_id, text) pairs and write the index to index_dir. doc_ids are namespaced
+    by source, e.g. "arxiv:0704.0001" or "patent:US9691429". Returns the number of rows.
+    """
+    embed_fn = load_embedder(embedder)
+    doc_ids, chunks, batch_ids, batch_texts = [], [], [], []
+    for doc_id, text in docs:
+        batch_ids.append(doc_id)
+        batch_texts.append(text)
+        if len(batch_texts) >= batch_size:
+            chunks.append(_embed(embed_fn, batch_texts))
+            doc_ids.extend(batch_ids)
+            batch_ids, batch_texts = [], []
+    if batch_texts:
+        chunks.append(_embed(embed_fn, batch_texts))
+        doc_ids.extend(batch_ids)
+    if not doc_ids:
+        raise ValueError("No documents to index")
+
+    vectors = np.concatenate(chunks)
+    n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+    n_lists = min(n_lists, len(vectors))
+    centroids = _kmeans(vectors, n_lists)
+
+    # Group rows by IVF list so each list is one contiguous slice of the file
+    assignment = np.argmax(vectors @ centroids.T, axis=1)
+    order = np.argsort(assignment, kind="stable")
+    vectors, assignment = vectors[order], assignment[order]
+    doc_ids = [doc_ids[i] for i in order]
+    offsets = np.searchsorted(assignment, np.arange(n_lists + 1)).astype(np.int64)
+
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    if dtype == "int8":
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        stored = np.round(vectors / scales[:, None]).astype(np.int8)
+        np.save(index_dir / "scales.npy", scales.astype(np.float32))
+    else:
+        stored = vectors.astype(np.float16)
+    stored.tofile(index_dir / "vectors.bin")
+    np.save(index_dir / "centroids.npy", centroids.astype(np.float32))
+    np.save(index_dir / "offsets.npy", offsets)
+    encoded = [doc_id.encode("utf-8") for doc_id in doc_ids]
+    doc_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(doc_id) for doc_id in encoded], out=doc_offsets[1:])
+    with open(index_dir / "doc_ids.bin", "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(index_dir / "doc_offsets.npy", doc_offsets)
+    with open(index_dir / "meta.json", "w") as f:
+        json.dump({"dim": int(vectors.shape[1]), "dtype": dtype, "count": len(doc_ids), "n_lists": n_lists,
+                   "embedder": embedder}, f)
+    return len(doc_ids)
+
+
+class _DocIds:
+    """Row -> doc id, read from the mmapped doc_ids.bin."""
+
+    def __init__(self, index_dir: Path):
+        self.offsets = np.load(index_dir / "doc_offsets.npy", mmap_mode="r")
+        self.data = memoryview(np.memmap(index_dir / "doc_ids.bin", mode="r", dtype=np.uint8))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return str(self.data[self.offsets[row]:self.offsets[row + 1]], "utf-8")
+
+
+class VectorIndex:
+    def __init__(self,
+                 index_dir: str | Path = default_index_dir,
+                 embed_fn: Optional[EmbedFn] = None,
+                 nprobe: int = 8):
+        self.index_dir = Path(index_dir)
+        self.nprobe = nprobe
+
+        with open(self.index_dir / "meta.json") as f:
+            self.meta = json.load(f)
+        # Queries must be embedded the way the index was built
+        self.embed_fn = embed_fn or load_embedder(self.meta.get("embedder", "hashed"))
+        self.vectors = np.memmap(self.index_dir / "vectors.bin", mode="r",
+                                 dtype=np.int8 if self.meta["dtype"] == "int8" else np.float16,
+                                 shape=(self.meta["count"], self.meta["dim"]))
+        self.scales = np.load(self.index_dir / "scales.npy", mmap_mode="r") if self.meta["dtype"] == "int8" else None
+        self.centroids = np.load(self.index_dir / "centroids.npy")
+        self.offsets = np.load(self.index_dir / "offsets.npy")
+        self.doc_ids = _DocIds(self.index_dir)
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    def search(self, text: str, k: int = 25, source: Optional[str] = None) -> List[tuple[str, float]]:
+        """
+        (doc_id, cosine similarity) of the k nearest documents, best first. source
+        restricts results to one namespace ("arxiv" or "patent") and strips its prefix.
+        """
+        query = _embed(self.embed_fn, [text])[0]
+        lists = np.argsort(-(self.centroids @ query))[:self.nprobe]
+
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in lists])
+        if not len(rows):
+            return []
+        candidates = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            candidates *= np.asarray(self.scales[rows])[:, None]
+        scores = candidates @ query
+
+        results = []
+        prefix = f"{source}:" if source else ""
+        for i in np.argsort(-scores):
+            doc_id = self.doc_ids[rows[i]]
+            if not doc_id.startswith(prefix):
+                continue
+            results.append((doc_id[len(prefix):], float(scores[i])))
+            if len(results) >= k:
+                break
+        return results
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """Merge several best-first ID rankings into one by summing 1 / (k + rank)."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
+
+
+_vector_index: Optional[VectorIndex] = None
+_vector_index_lock = threading.Lock()
+
+
+def vector_index_dir() -> Path:
+    return Path(os.environ.get("VECTOR_INDEX_DIR", default_index_dir))
+
+
+def vector_index_embedder() -> str:
+    return os.environ.get("VECTOR_INDEX_EMBEDDER", "hashed")
+
+
+def get_vector_index() -> Optional[VectorIndex]:
+    """Process-wide index, or None if it hasn't been built yet or semantic search is off."""
+    global _vector_index
+    if semantic_search_mode == "off":
+        return None
+    with _vector_index_lock:
+        # Indexes from before doc ids were mmapped (docs.jsonl) need a rebuild
+        if _vector_index is None and (vector_index_dir() / "doc_offsets.npy").exists():
+            _vector_index = VectorIndex(vector_index_dir(), nprobe=int(os.environ.get("VECTOR_INDEX_NPROBE", 8)))
+        return _vector_index
+
+
+def _corpus(include_arxiv: bool, include_patents: bool) -> Iterable[tuple[str, str]]:
+    if include_arxiv:
+        from utils.arxiv_index import get_arxiv_index
+        arxiv_index = get_arxiv_index()
+        for paper_id, title, abstract in arxiv_index.iter_documents() if arxiv_index is not None else ():
+            yield f"arxiv:{paper_id}", f"{title}\n{abstract}"
+    if include_patents:
+        from utils.patent_store import get_patent_store
+        for document in get_patent_store().iter_documents():
+            yield f"patent:{document.id}", f"{document.title or ''}\n{document.abstract or ''}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dense vector index over arXiv and patent abstracts")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build_parser = subcommands.add_parser("build", help="(Re)build the index from the arXiv index and patent store")
+    build_parser.add_argument("--no-arxiv", action="store_true")
+    build_parser.add_argument("--no-patents", action="store_true")
+    build_parser.add_argument("--dtype", choices=("float16", "int8"), default="float16")
+    build_parser.add_argument("--embedder", default=vector_index_embedder(),
+                              help="hashed, sentence-transformers:<model> or module:function (default VECTOR_INDEX_EMBEDDER)")
+    search_parser = subcommands.add_parser("search", help="Query the index")
+    search_parser.add_argument("text")
+    search_parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        count = build_index(vector_index_dir(), _corpus(not args.no_arxiv, not args.no_patents),
+                            embedder=args.embedder, dtype=args.dtype)
+        print(f"Indexed {count} documents in {time.perf_counter() - start:.1f}s")
+    else:
+        index = get_vector_index()
+        if index is None:
+            raise SystemExit(f"No index at {vector_index_dir()}, run the build command first")
+        start = time.perf_counter()
+        results = index.search(args.text, args.k)
+        print(f"{len(results)} results in {(time.perf_counter() - start) * 1000:.1f}ms")
+        for doc_id, score in results:
+            print(f"- {doc_id} ({score:.3f})")
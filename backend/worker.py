@@ -0,0 +1,38 @@
+from dotenv import load_dotenv
+
+# Loaded once, before the modules below read their configuration at import
+load_dotenv()
+
+from controllers.patent_controller import PATENT_SEARCH_JOB, fpo_search_backend, run_patent_search_job
+from utils.driver_pool import get_driver_pool
+from utils.job_queue import JobWorkerPool, get_job_queue
+import argparse
+import os
+import signal
+import threading
+
+"""
+Worker process for background patent search jobs queued through /api/jobs/search_patents.
+Runs independently of the web server so scraping capacity can be scaled separately:
+
+    python worker.py --concurrency 4
+"""
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background search jobs")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("JOB_WORKER_CONCURRENCY", 2)))
+    args = parser.parse_args()
+
+    if fpo_search_backend == "selenium":
+        get_driver_pool().warm()
+    pool = JobWorkerPool(get_job_queue(), {PATENT_SEARCH_JOB: run_patent_search_job}, concurrency=args.concurrency)
+    pool.start()
+    print(f"Worker started with {args.concurrency} threads")
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    stopped.wait()
+
+    pool.stop()
+    get_driver_pool().close()
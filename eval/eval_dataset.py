@@ -0,0 +1,257 @@
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+import argparse
+import json
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Ground truth patent IDs are normalized the way the backend's patent store keys them
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+"""
+Eval datasets, from their CSV source or compiled to a columnar on-disk format.
+
+The CSVs in datasets/ are what gets edited and reviewed. Large generated sets can be
+compiled once so that runs load them without parsing anything:
+
+    python eval/eval_dataset.py compile eval/datasets/patent_evals.csv
+
+On-disk layout (one directory, default eval/.cache/datasets/<csv name>):
+    meta.json                   case count and the case types type_codes refers to
+    ids.bin, inputs.bin         UTF-8 strings concatenated, one per case, opened with np.memmap
+    ids_offsets.npy, ...        n + 1 byte offsets of the strings in the matching .bin
+    titles.bin                  distinct titles, with titles_offsets.npy
+    title_codes.npy             index into titles of each case
+    type_codes.npy              index into meta["types"] of each case
+    demo.npy                    demo flag of each case
+    ground_truth.bin            normalized ground truth IDs of all cases, with ground_truth_offsets.npy
+    ground_truth_starts.npy     n + 1 indexes of each case's first ground truth ID
+
+Filtering by type, demo flag or title only compares the small per-case code arrays,
+and a case's strings are only read and decoded when it is iterated.
+"""
+
+case_types = ("arxiv", "patent")
+default_compiled_dir = Path(__file__).resolve().parent / ".cache" / "datasets"
+
+
+@dataclass
+class EvalCase:
+    id: str
+    title: str
+    type: str
+    demo: bool
+    input: str
+    ground_truth: List[str]
+
+
+def normalize_id(item_id: str, case_type: str) -> str:
+    """
+    Canonical form for comparing predicted IDs with ground truth. The arXiv ground
+    truth went through a float on its way into the CSVs ('0703042' -> '703042.0'), so
+    arXiv IDs are compared with their archive prefix, version and leading zeros removed.
+    """
+    if case_type == 'patent':
+        from utils.patent_store import normalize_patent_id
+        return normalize_patent_id(item_id)
+
+    item_id = re.sub(r'v\d+$', '', str(item_id).split('/')[-1]).upper()
+    try:
+        return repr(float(item_id))
+    except ValueError:
+        return item_id
+
+
+def read_csv(csv_path: str | Path) -> pd.DataFrame:
+    """
+    The cases of an eval CSV, with demo as a bool and ground_truth parsed from its
+    stringified list ("['US9691429B2']", "[8095879, 8812993]") into normalized,
+    de-duplicated IDs.
+
+    Raises:
+        ValueError: If a case has an unsupported type
+    """
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    unsupported = sorted(set(df['type']) - set(case_types))
+    if unsupported:
+        raise ValueError(f"Unsupported evaluation case type: {unsupported[0]}")
+    df['demo'] = df['demo'].str.lower() == 'true'
+
+    # One row per ground truth item, indexed by its case's row
+    items = df['ground_truth'].str.strip('[]').str.split(',').explode().str.strip().str.strip('"\'')
+    items = items[items != '']
+    normalized = pd.Series([normalize_id(item, case_type) for item, case_type in zip(items, df['type'][items.index])],
+                           index=items.index, dtype=object)
+    normalized = normalized[~normalized.reset_index().duplicated().to_numpy()]
+    grouped = normalized.groupby(level=0).agg(list)
+    df['ground_truth'] = [grouped.get(row, []) for row in df.index]
+    return df[['id', 'title', 'type', 'demo', 'input', 'ground_truth']]
+
+
+def _write_strings(out_dir: Path, name: str, strings: Iterable[str]) -> None:
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    with open(out_dir / f"{name}.bin", "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(out_dir / f"{name}_offsets.npy", offsets)
+
+
+def compile_dataset(csv_path: str | Path, out_dir: str | Path) -> int:
+    """Write the columnar form of an eval CSV to out_dir and return its case count."""
+    df = read_csv(csv_path)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    title_codes, titles = pd.factorize(df['title'])
+    ground_truth_starts = np.zeros(len(df) + 1, dtype=np.int64)
+    np.cumsum(df['ground_truth'].str.len().to_numpy(), out=ground_truth_starts[1:])
+
+    _write_strings(out_dir, "ids", df['id'])
+    _write_strings(out_dir, "inputs", df['input'])
+    _write_strings(out_dir, "titles", titles)
+    _write_strings(out_dir, "ground_truth", (item for items in df['ground_truth'] for item in items))
+    np.save(out_dir / "title_codes.npy", title_codes.astype(np.int32))
+    np.save(out_dir / "type_codes.npy", pd.Categorical(df['type'], categories=case_types).codes.astype(np.int8))
+    np.save(out_dir / "demo.npy", df['demo'].to_numpy(dtype=bool))
+    np.save(out_dir / "ground_truth_starts.npy", ground_truth_starts)
+    # Written last, so an interrupted compile isn't mistaken for a dataset
+    with open(out_dir / "meta.json", "w") as f:
+        json.dump({"count": len(df), "types": list(case_types), "source": str(csv_path)}, f)
+    return len(df)
+
+
+class _Strings:
+    """A memory-mapped string column: concatenated UTF-8 bytes plus offsets."""
+
+    def __init__(self, path: Path, name: str):
+        self.offsets = np.load(path / f"{name}_offsets.npy", mmap_mode="r")
+        # np.memmap can't map an empty file
+        self.data = memoryview(np.memmap(path / f"{name}.bin", mode="r", dtype=np.uint8)
+                               if self.offsets[-1] else b"")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def take(self, rows: np.ndarray) -> List[str]:
+        starts, ends = self.offsets[rows].tolist(), self.offsets[rows + 1].tolist()
+        return [str(self.data[start:end], "utf-8") for start, end in zip(starts, ends)]
+
+
+class EvalDataset:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path / "meta.json") as f:
+            self.meta = json.load(f)
+        self.types = self.meta["types"]
+        self.ids = _Strings(self.path, "ids")
+        self.inputs = _Strings(self.path, "inputs")
+        self.titles = _Strings(self.path, "titles")
+        self.ground_truth = _Strings(self.path, "ground_truth")
+        self.title_codes = np.load(self.path / "title_codes.npy", mmap_mode="r")
+        self.type_codes = np.load(self.path / "type_codes.npy", mmap_mode="r")
+        self.demo = np.load(self.path / "demo.npy", mmap_mode="r")
+        self.ground_truth_starts = np.load(self.path / "ground_truth_starts.npy", mmap_mode="r")
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    @cached_property
+    def _title_codes_by_title(self) -> dict[str, int]:
+        return {self.titles[code]: code for code in range(len(self.titles))}
+
+    def select(self, type: Optional[str] = None, demo: Optional[bool] = None,
+               title: Optional[str] = None) -> np.ndarray:
+        """Rows of the cases matching every given filter, in dataset order."""
+        mask = np.ones(len(self), dtype=bool)
+        if type is not None:
+            mask &= self.type_codes == (self.types.index(type) if type in self.types else -1)
+        if demo is not None:
+            mask &= self.demo == demo
+        if title is not None:
+            mask &= self.title_codes == self._title_codes_by_title.get(title, -1)
+        return np.flatnonzero(mask)
+
+    def _cases(self, rows: np.ndarray) -> List[EvalCase]:
+        starts, ends = self.ground_truth_starts[rows], self.ground_truth_starts[rows + 1]
+        counts = ends - starts
+        # Every ground truth item of these rows, in row order: each row's start, shifted
+        # by where that row's items begin in the output, plus the position in the output
+        item_rows = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        items = iter(self.ground_truth.take(item_rows))
+        counts = counts.tolist()
+        return [
+            EvalCase(id=case_id, title=self.titles[title_code], type=self.types[type_code], demo=demo,
+                     input=input, ground_truth=[next(items) for _ in range(count)])
+            for case_id, title_code, type_code, demo, input, count in zip(
+                self.ids.take(rows), self.title_codes[rows].tolist(), self.type_codes[rows].tolist(),
+                self.demo[rows].tolist(), self.inputs.take(rows), counts)
+        ]
+
+    def case(self, row: int) -> EvalCase:
+        return self._cases(np.array([row]))[0]
+
+    def iter_cases(self, rows: Optional[np.ndarray] = None, chunk_size: int = 1024) -> Iterator[EvalCase]:
+        """The cases at rows (all of them by default), read and decoded chunk_size at a time."""
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.int64)
+        for start in range(0, len(rows), chunk_size):
+            yield from self._cases(rows[start:start + chunk_size])
+
+
+def load_eval_cases(path: str | Path,
+                    type: Optional[str] = None,
+                    demo: Optional[bool] = None,
+                    title: Optional[str] = None,
+                    limit: Optional[int] = None) -> List[EvalCase]:
+    """
+    Load the evaluation cases of a CSV file or a compiled dataset directory, keeping
+    those that match every given filter.
+
+    Args:
+        path: Path to the evals CSV file or compiled dataset
+        type, demo, title: Only keep cases with this type, demo flag or title
+        limit: Only keep the first N matching cases
+
+    Returns:
+        List of EvalCase objects with normalized ground truth
+    """
+    path = Path(path)
+    if path.is_dir():
+        dataset = EvalDataset(path)
+        return list(dataset.iter_cases(dataset.select(type, demo, title)[:limit]))
+
+    df = read_csv(path)
+    mask = np.ones(len(df), dtype=bool)
+    if type is not None:
+        mask &= df['type'] == type
+    if demo is not None:
+        mask &= df['demo'] == demo
+    if title is not None:
+        mask &= df['title'] == title
+    df = df[mask].head(limit) if limit is not None else df[mask]
+    return [EvalCase(*row) for row in zip(df['id'], df['title'], df['type'], df['demo'], df['input'], df['ground_truth'])]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile eval CSVs to the columnar dataset format")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    compile_parser = subcommands.add_parser("compile", help="Compile eval CSVs")
+    compile_parser.add_argument("csvs", nargs="+")
+    compile_parser.add_argument("--out-dir", type=Path, default=default_compiled_dir,
+                                help="each CSV is compiled to a directory named after it in here")
+    args = parser.parse_args()
+
+    for csv_path in map(Path, args.csvs):
+        start = time.perf_counter()
+        out_dir = args.out_dir / csv_path.stem
+        count = compile_dataset(csv_path, out_dir)
+        print(f"Compiled {count} cases from {csv_path} to {out_dir} in {time.perf_counter() - start:.2f}s")
@@ -1,12 +1,36 @@
 from litellm import acompletion
-from dataclasses import dataclass
-from typing import List
+from dataclasses import asdict, dataclass
+from typing import List, Optional
 import pandas as pd
+import argparse
 import asyncio
+import json
 from tqdm import tqdm
 from run_evals import EvalCase
+from pathlib import Path
+import sys
 import uuid
 
+# The backend's LLM rate limiter, configured from the same ANTHROPIC_RPM/TPM settings. This
+# process has its own instance, so it only keeps generation itself within those limits:
+# it doesn't coordinate with a running server, whose searches compete for the same quota.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+from utils.rate_limiter import BATCH, estimate_tokens, get_rate_limiter, is_rate_limit_error
+
+"""
+Generate patent eval cases: for each source patent, ask the LLM for product ideas that
+infringe it, and turn every idea into an EvalCase whose ground truth is that patent.
+
+Patents are generated concurrently. Each finished patent is appended to a JSONL
+checkpoint right away, so an interrupted run loses nothing and rerunning with the same
+checkpoint only generates the patents that aren't in it yet. Unparseable responses are
+retried; patents that still fail are reported and left for the next run.
+"""
+
+eval_dir = Path(__file__).resolve().parent
+default_sources = eval_dir / "sources" / "random_patents.csv"
+default_checkpoint = eval_dir / "generated_ideas.jsonl"
+
 @dataclass
 class Patent:
     id: str
@@ -23,7 +47,28 @@ class InfringingIdea:
 class InfringingIdeaResponse:
     infringing_ideas: List[InfringingIdea]
 
-async def process_patents_from_csv(csv_path: str) -> List[tuple[Patent, InfringingIdeaResponse]]:
+def load_checkpoint(checkpoint_path: Path) -> List[tuple[Patent, InfringingIdeaResponse]]:
+    """The patents already generated, one JSON object per line."""
+    results = []
+    if not checkpoint_path.exists():
+        return results
+    with open(checkpoint_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run, its patent is generated again
+                continue
+            ideas = [InfringingIdea(**idea) for idea in entry["infringing_ideas"]]
+            results.append((Patent(**entry["patent"]), InfringingIdeaResponse(infringing_ideas=ideas)))
+    return results
+
+async def process_patents_from_csv(csv_path: str,
+                                   checkpoint_path: Path = default_checkpoint,
+                                   concurrency: int = 8,
+                                   retries: int = 3) -> List[tuple[Patent, InfringingIdeaResponse]]:
     # Read the CSV file
     df = pd.read_csv(csv_path)
     
@@ -33,16 +78,54 @@ async def process_patents_from_csv(csv_path: str) -> List[tuple[Patent, Infringi
         for _, row in df.iterrows()
         if pd.notna(row['abstract'])  # Skip rows with missing abstracts
     ]
-    
-    # Process patents one at a time with progress bar
-    results = []
-    for patent in tqdm(patents):
-        result = await generate_infringing_ideas(patent)
-        results.append((patent, result))
-    
+
+    results = load_checkpoint(checkpoint_path)
+    done = {patent.id for patent, _ in results}
+    pending = [patent for patent in patents if patent.id not in done]
+    if done:
+        print(f"Resuming: {len(patents) - len(pending)} of {len(patents)} patents already in {checkpoint_path}")
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def generate(patent: Patent) -> tuple[Patent, Optional[InfringingIdeaResponse]]:
+        async with slots:
+            try:
+                return patent, await generate_infringing_ideas(patent, retries)
+            except Exception as e:
+                print(f"Skipping {patent.id}: {e!r}")
+                return patent, None
+
+    failed = 0
+    with open(checkpoint_path, "a+") as checkpoint:
+        # Start on a fresh line after one cut short by an interrupted run
+        if checkpoint.tell() > 0:
+            checkpoint.seek(checkpoint.tell() - 1)
+            if checkpoint.read(1) != "\n":
+                checkpoint.write("\n")
+        for task in tqdm(asyncio.as_completed([generate(patent) for patent in pending]), total=len(pending)):
+            patent, result = await task
+            if result is None:
+                failed += 1
+                continue
+            checkpoint.write(json.dumps({"patent": asdict(patent), **asdict(result)}) + "\n")
+            checkpoint.flush()
+            results.append((patent, result))
+
+    if failed:
+        print(f"{failed} patents failed, rerun to retry them")
     return results
 
-async def generate_infringing_ideas(patent: Patent):
+def parse_infringing_ideas(content: str) -> InfringingIdeaResponse:
+    # Tolerate prose or code fences around the JSON object
+    start, end = content.find("{"), content.rfind("}")
+    response_json = json.loads(content[start:end + 1] if start != -1 else content)
+    ideas = [
+        InfringingIdea(**idea) 
+        for idea in response_json["infringing_ideas"]
+    ]
+    return InfringingIdeaResponse(infringing_ideas=ideas)
+
+async def generate_infringing_ideas(patent: Patent, retries: int = 3) -> InfringingIdeaResponse:
     prompt = f"""
 You are a product manager who has a tendency to come up with ideas that infringe upon existing patents.
 Given the provided patent abstract, you must come up with 10 product ideas that would technically infringe upon 1 or many of the components in the patent.
@@ -69,23 +152,27 @@ Output a list of 10 product ideas adhering to the below json format:
 Make sure each idea is unique and creative while clearly infringing on key aspects of the patent.
 """
 
-    response = await acompletion(
-        model="anthropic/claude-3-5-haiku-20241022",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=1.0
-    )
-    
-    # Parse JSON response into dataclass
-    import json
-    response_json = json.loads(response.choices[0].message.content.strip())
-    ideas = [
-        InfringingIdea(**idea) 
-        for idea in response_json["infringing_ideas"]
-    ]
-    return InfringingIdeaResponse(infringing_ideas=ideas)
+    # Sampled at temperature 1.0, so a malformed response is simply asked for again
+    for attempt in range(retries + 1):
+        try:
+            async with get_rate_limiter().apermit(estimate_tokens(prompt), priority=BATCH):
+                response = await acompletion(
+                    model="anthropic/claude-3-5-haiku-20241022",
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=1.0
+                )
+            # Parse JSON response into dataclass
+            return parse_infringing_ideas(response.choices[0].message.content.strip())
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            if attempt == retries:
+                raise ValueError(f"Unparseable response after {retries + 1} attempts") from e
+        except Exception as e:
+            # The rate limiter has already backed off
+            if not is_rate_limit_error(e) or attempt == retries:
+                raise
 
-async def main():
-    results = await process_patents_from_csv("./eval/arxiv_sources.csv")
+async def main(sources: Path, checkpoint: Path, concurrency: int, retries: int):
+    results = await process_patents_from_csv(sources, checkpoint, concurrency, retries)
     
     # Convert results to evaluation format
     eval_cases = []
@@ -104,10 +191,19 @@ async def main():
     return eval_cases
 
 if __name__ == "__main__":
-    eval_cases = asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Generate patent eval cases from source patents")
+    parser.add_argument("sources", nargs="?", default=default_sources, help="CSV with id, name and abstract columns")
+    parser.add_argument("--checkpoint", type=Path, default=default_checkpoint,
+                        help="JSONL of generated patents, appended as they finish and skipped on rerun")
+    parser.add_argument("--concurrency", type=int, default=8, help="patents generated at once")
+    parser.add_argument("--retries", type=int, default=3, help="retries per patent on unparseable responses")
+    parser.add_argument("--output", default="generated_eval_cases.csv")
+    args = parser.parse_args()
+
+    eval_cases = asyncio.run(main(args.sources, args.checkpoint, args.concurrency, args.retries))
     
     # Convert eval cases to DataFrame and save to CSV
-    output_file = "generated_eval_cases.csv"  # You can change this variable name as needed
+    output_file = args.output
     eval_df = pd.DataFrame([vars(case) for case in eval_cases])
     eval_df.to_csv(output_file, index=False)
     print(f"Evaluation cases saved to {output_file}")
\ No newline at end of file
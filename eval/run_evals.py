@@ -1,23 +1,30 @@
-import pandas as pd
-from typing import List, Dict
+from typing import List, Dict, Sequence
 from dataclasses import dataclass, field
 from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import sys
 import time
 
-@dataclass
-class EvalCase:
-    id: int
-    title: str
-    type: str
-    demo: bool
-    input: str
-    ground_truth: List[str]
+from dotenv import load_dotenv
+
+from eval_dataset import EvalCase, load_eval_cases, normalize_id
+
+# The pipelines under test live in the backend, and read its .env like main.py does
+backend_dir = Path(__file__).resolve().parent.parent / "backend"
+sys.path.append(str(backend_dir))
+load_dotenv(backend_dir / ".env")
+
+datasets_dir = Path(__file__).resolve().parent / "datasets"
 
 @dataclass
 class EvalRun:
     """Stores evaluation results and calculates metrics for an evaluation run."""
-    results: Dict[int, dict]
+    results: Dict[str, dict]
     timestamp: float = field(default_factory=time.time)
+    wall_seconds: float = 0.0
 
     @property
     def total_cases(self) -> int:
@@ -33,149 +40,184 @@ class EvalRun:
     def pass_rate(self) -> float:
         """Percentage of passing cases."""
         return (self.passed_cases / self.total_cases) * 100 if self.total_cases > 0 else 0
+
+    @property
+    def errored_cases(self) -> int:
+        """Number of cases whose pipeline raised."""
+        return sum(1 for result in self.results.values() if result.get('error'))
+
+    def recall_at(self, k: int) -> float:
+        """Mean fraction of each case's ground truth found in its top k predictions."""
+        recalls = [
+            len(set(result['expected']) & set(result['predicted'][:k])) / len(result['expected'])
+            for result in self.results.values() if result['expected']
+        ]
+        return sum(recalls) / len(recalls) if recalls else 0.0
+
+    @property
+    def mrr(self) -> float:
+        """Mean reciprocal rank of the first correct prediction (0 when none is found)."""
+        reciprocal_ranks = []
+        for result in self.results.values():
+            expected = set(result['expected'])
+            rank = next((i for i, item in enumerate(result['predicted'], start=1) if item in expected), None)
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+        return sum(reciprocal_ranks) / len(reciprocal_ranks) if reciprocal_ranks else 0.0
+
+    def latency_percentile(self, percentile: float) -> float:
+        """Per-case latency in seconds at the given percentile (nearest rank)."""
+        latencies = sorted(result['latency_seconds'] for result in self.results.values())
+        if not latencies:
+            return 0.0
+        rank = max(1, -(-len(latencies) * percentile // 100))
+        return latencies[int(rank) - 1]
+
+    def llm_totals(self) -> Dict[str, int]:
+        """LLM calls, tokens and cache hits summed over all cases."""
+        totals: Dict[str, int] = {}
+        for result in self.results.values():
+            for name, value in result['llm_usage'].items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
     
-    def get_failed_cases(self) -> List[int]:
+    def get_failed_cases(self) -> List[str]:
         """Returns list of case IDs that failed."""
         return [case_id for case_id, result in self.results.items() if not result['passed']]
     
-    def summary(self) -> str:
+    def summary(self, ks: Sequence[int] = (1, 5, 10)) -> str:
         """Returns a formatted summary of the evaluation results."""
+        usage = self.llm_totals()
         summary_lines = [
             f"Evaluation Summary:",
-            f"Total cases: {self.total_cases}",
+            f"Total cases: {self.total_cases} ({self.errored_cases} errored) in {self.wall_seconds:.1f}s",
             f"Passed cases: {self.passed_cases}",
-            f"Pass rate: {self.pass_rate:.1f}%"
+            f"Pass rate: {self.pass_rate:.1f}%",
+            *[f"Recall@{k}: {self.recall_at(k):.3f}" for k in ks],
+            f"MRR: {self.mrr:.3f}",
+            f"Latency p50/p95/p99: {self.latency_percentile(50):.1f}s / "
+            f"{self.latency_percentile(95):.1f}s / {self.latency_percentile(99):.1f}s",
+            f"LLM calls: {usage.get('requests', 0)} (+{usage.get('cached_responses', 0)} served from the response cache)",
+            f"LLM tokens: {usage.get('input_tokens', 0)} input, {usage.get('output_tokens', 0)} output, "
+            f"{usage.get('cache_read_input_tokens', 0)} read from the prompt cache "
+            f"({usage.get('prompt_cache_hits', 0)} calls)",
         ]
         return "\n".join(summary_lines)
 
+    def to_dict(self, ks: Sequence[int] = (1, 5, 10)) -> dict:
+        return {
+            "timestamp": self.timestamp,
+            "wall_seconds": self.wall_seconds,
+            "total_cases": self.total_cases,
+            "pass_rate": self.pass_rate,
+            "recall": {k: self.recall_at(k) for k in ks},
+            "mrr": self.mrr,
+            "latency_seconds": {f"p{p}": self.latency_percentile(p) for p in (50, 95, 99)},
+            "llm_usage": self.llm_totals(),
+            "results": self.results,
+        }
 
-def load_eval_cases(csv_path: str | Path) -> List[EvalCase]:
-    """
-    Load evaluation cases from a CSV file into a list of EvalCase objects.
-    
-    Args:
-        csv_path: Path to the evals CSV file
-        
-    Returns:
-        List of EvalCase objects containing the parsed data
-    """
-    df = pd.read_csv(csv_path)
-    
-    eval_cases = []
-    for _, row in df.iterrows():
-        
-        if row['type'] == 'patent':
-            # Convert string representation of list to actual list based on type
-            ground_truth_str = row['ground_truth'].strip('[]')
-
-            # For patent type, split by comma and strip quotes, spaces, and ensure clean patent IDs
-            ground_truth = [x.strip().strip('"\'').upper() for x in ground_truth_str.split(',') if x.strip()]
-        elif row['type'] == 'arxiv':
-            # does the same as patents... lol
-
-            # Convert string representation of list to actual list based on type
-            ground_truth_str = row['ground_truth'].strip('[]')
-
-            # For patent type, split by comma and strip quotes, spaces, and ensure clean patent IDs
-            ground_truth = [x.strip().strip('"\'').upper() for x in ground_truth_str.split(',') if x.strip()]
-        else:
-            raise ValueError(f"Unsupported evaluation case type: {row['type']}")
-        
-        case = EvalCase(
-            id=row['id'],
-            title=row['title'],
-            type=row['type'],
-            demo=row['demo'],
-            input=row['input'],
-            ground_truth=ground_truth
-        )
-        eval_cases.append(case)
-    
-    return eval_cases
 
-def dummy_process_input(input_text: str, case_type: str) -> List[str]:
+async def process_input(input_text: str, case_type: str) -> List[str]:
     """
-    Placeholder function that simulates processing input text.
-    In practice, this would be replaced with your actual processing logic.
-    
-    Args:
-        input_text: The input text to process
-        case_type: The type of case being processed (e.g. 'patent')
-        
-    Returns:
-        List of processed strings
-        
+    Run the input through the same search pipeline the API serves and return the
+    ranked result IDs.
+
     Raises:
         ValueError: If case_type is not recognized
     """
     if case_type == 'patent':
-        # For patent type, return 5 random numbers as strings
-        import random
-        return [str(random.randint(0, 9000000)) for _ in range(5)]
+        from controllers.patent_controller import search_patents_by_description
+        return [patent.id for patent in await search_patents_by_description(input_text)]
 
     if case_type == 'arxiv':
-        # For patent type, return 5 random numbers as strings
-        import random
-        return ['random', 'arxiv', 'ids']
+        from controllers.arxiv_controller import search_by_description
+        return [paper.paper_id for paper in await search_by_description(input_text)]
     
     raise ValueError(f"Unsupported case type: {case_type}")
 
-def run_and_evaluate(eval_cases: List[EvalCase]) -> EvalRun:
+async def run_case(case: EvalCase) -> dict:
+    from utils.llm import track_usage
+
+    error = None
+    start = time.perf_counter()
+    with track_usage() as usage:
+        try:
+            predicted_output = await process_input(case.input, case.type)
+        except Exception as e:
+            print(f"Case {case.id} failed: {e!r}")
+            predicted_output, error = [], repr(e)
+    latency = time.perf_counter() - start
+
+    # Ground truth is normalized when the dataset is loaded
+    expected = case.ground_truth
+    predicted = list(dict.fromkeys(normalize_id(item, case.type) for item in predicted_output))
+    return {
+        'title': case.title,
+        'type': case.type,
+        'expected': expected,
+        'predicted': predicted,
+        # Order doesn't matter for passing: every ground truth item must be found
+        'passed': all(item in predicted for item in expected),
+        'latency_seconds': latency,
+        'llm_usage': usage.to_dict(),
+        'error': error,
+    }
+
+async def run_and_evaluate(eval_cases: List[EvalCase], concurrency: int = 4) -> EvalRun:
     """
-    Run evaluation cases through the processing function and compare with expected output.
+    Run evaluation cases through the search pipelines, at most concurrency at a time,
+    and compare the ranked results with the expected output.
     
     Args:
         eval_cases: List of EvalCase objects to evaluate
+        concurrency: Max number of cases in flight
         
     Returns:
         EvalRun object containing evaluation results and metrics
     """
-    results = {}
-    
-    for case in eval_cases:
-        # Run the input through processing
-        predicted_output = dummy_process_input(case.input, case.type)
+    from utils.rate_limiter import BATCH, current_priority
 
-        # TODO parse the predicted output depending on case type
-        
-        # Initialize result dictionary
-        result = {
-            'title': case.title,
-            'type': case.type,
-            'expected': case.ground_truth,
-            'predicted': predicted_output,
-            'passed': False
-        }
-        
-        # Evaluate based on case type
-        if case.type == 'patent':
-            # Assert that predicted_output is a list
-            assert isinstance(predicted_output, list), f"Predicted output must be a list, got {type(predicted_output)}"
-            
-            # Check if all ground truth patents are in predicted output (order doesn't matter)
-            result['passed'] = all(gt_patent in predicted_output for gt_patent in case.ground_truth)
-        elif case.type == 'arxiv':
-            # Does same thing as patent
-            # Assert that predicted_output is a list
-            assert isinstance(predicted_output, list), f"Predicted output must be a list, got {type(predicted_output)}"
-            
-            # Check if all ground truth patents are in predicted output (order doesn't matter)
-            result['passed'] = all(gt_patent in predicted_output for gt_patent in case.ground_truth)
-        else:
-            raise ValueError(f"Unknown evaluation case type: {case.type}")
-            
-        results[case.id] = result
-    
-    return EvalRun(results=results)
+    # Eval traffic yields to interactive searches in the shared LLM rate limiter
+    current_priority.set(BATCH)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def bounded(case: EvalCase) -> dict:
+        async with slots:
+            return await run_case(case)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[bounded(case) for case in eval_cases])
+    return EvalRun(results={case.id: result for case, result in zip(eval_cases, results)},
+                   wall_seconds=time.perf_counter() - start)
 
-# Example usage
 if __name__ == "__main__":
-    eval_cases = load_eval_cases('eval/datasets/arxiv_evals.csv')
-    # eval_cases = load_eval_cases('eval/datasets/demo_evals.csv')
-    eval_run = run_and_evaluate(eval_cases)
+    parser = argparse.ArgumentParser(description="Run eval cases through the search pipelines")
+    parser.add_argument("datasets", nargs="*",
+                        default=[datasets_dir / "arxiv_evals.csv", datasets_dir / "patent_evals.csv"],
+                        help="eval CSVs or compiled datasets (see eval_dataset.py)")
+    parser.add_argument("--concurrency", type=int, default=4, help="cases run at once")
+    parser.add_argument("--limit", type=int, help="only run the first N cases of each dataset")
+    parser.add_argument("--type", choices=("arxiv", "patent"), help="only run cases of this type")
+    parser.add_argument("--demo", choices=("true", "false"), help="only run demo (or non-demo) cases")
+    parser.add_argument("--title", help="only run cases with this title")
+    parser.add_argument("-k", type=int, action="append", help="recall cutoffs to report (default 1, 5, 10)")
+    parser.add_argument("--cascade", choices=("on", "off"),
+                        help="score with the fast/strong model cascade or the strong model only (default LLM_CASCADE)")
+    parser.add_argument("--output", help="write the full results as JSON to this path")
+    args = parser.parse_args()
+    ks = args.k or [1, 5, 10]
+    if args.cascade:
+        # Read by utils/models.py, which isn't imported until the first case runs
+        os.environ["LLM_CASCADE"] = "true" if args.cascade == "on" else "false"
+
+    eval_cases = []
+    for dataset in args.datasets:
+        eval_cases.extend(load_eval_cases(dataset, args.type, None if args.demo is None else args.demo == "true",
+                                          args.title, args.limit))
+    eval_run = asyncio.run(run_and_evaluate(eval_cases, args.concurrency))
     
     # Print summary
-    print(eval_run.summary())
+    print(eval_run.summary(ks))
     
     # Print detailed results if needed
     for case_id in eval_run.get_failed_cases():
@@ -183,3 +225,7 @@ if __name__ == "__main__":
         print(f"\nFailed Case {case_id}: {result['title']}")
         print(f"Expected: {result['expected']}")
         print(f"Predicted: {result['predicted']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(eval_run.to_dict(ks), f, indent=2, default=str)
@@ -14,6 +14,7 @@ import { Loader2, ChevronDown, ChevronUp, ChevronRight } from "lucide-react"
 import { cn } from "@/lib/utils"
 
 interface ArxivPaper {
+  paper_id: string
   title: string
   summary: string
   authors: string[]
@@ -30,6 +31,58 @@ interface Patent {
   relevance_score: number
 }
 
+type SearchEvent<T> =
+  | { event: 'query', query?: string, queries?: string[] }
+  | { event: 'paper', paper: T }
+  | { event: 'patent', patent: T }
+  | { event: 'done', ranking: string[] }
+  | { event: 'error', message: string }
+
+// Reads an NDJSON response body, calling onEvent for every line as it arrives. Rejects if
+// the server reports an error or the stream ends before the done event.
+async function streamEvents<T>(url: string, body: object, onEvent: (event: SearchEvent<T>) => void) {
+  const response = await fetch(url, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(body),
+  })
+  if (!response.ok || !response.body) throw new Error(`Failed to fetch ${url}`)
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let finished = false
+  const handleLine = (line: string) => {
+    const event: SearchEvent<T> = JSON.parse(line)
+    if (event.event === 'error') throw new Error(event.message)
+    if (event.event === 'done') finished = true
+    onEvent(event)
+  }
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    const lines = buffer.split('\n')
+    buffer = lines.pop() ?? ''
+    lines.filter(line => line.trim()).forEach(handleLine)
+  }
+  if (buffer.trim()) handleLine(buffer)
+  if (!finished) throw new Error(`Search stream from ${url} ended early`)
+}
+
+// Insert a result as it streams in, keeping the list sorted by score
+function insertByScore<T extends { relevance_score: number }>(items: T[], item: T): T[] {
+  return [...items, item].sort((a, b) => b.relevance_score - a.relevance_score)
+}
+
+// Apply the server's final ranking, dropping anything it filtered out
+function applyRanking<T>(items: T[], ranking: string[], key: (item: T) => string): T[] {
+  const byKey = new Map(items.map(item => [key(item), item]))
+  return ranking.flatMap(id => byKey.get(id) ?? [])
+}
+
 interface PaperCardProps {
   paper: ArxivPaper
 }
@@ -101,7 +154,7 @@ function CollapsibleSection({
           type === 'papers' ? <PaperSearchLoadingText /> : <PatentSearchLoadingText />
         )}
       </div>
-      {!isEmpty && !isLoading && isExpanded && (
+      {!isEmpty && isExpanded && (
         <div className="space-y-4 pt-2 transition-all duration-200">
           {children}
         </div>
@@ -314,41 +367,33 @@ export default function Home() {
     setError(null)
     setIsPapersLoading(true)
     setIsPatentsLoading(true)
+    setPapers([])
+    setPatents([])
 
-    // Search papers
-    fetch('http://localhost:8000/api/search', {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        description: description,
-        max_papers: 10
-      }),
+    // Search papers, rendering each one as soon as it is scored
+    streamEvents<ArxivPaper>('http://localhost:8000/api/search/stream', {
+      description: description,
+      max_papers: 10
+    }, event => {
+      if (event.event === 'paper') {
+        setPapers(papers => insertByScore(papers.filter(p => p.paper_id !== event.paper.paper_id), event.paper))
+      } else if (event.event === 'done') {
+        setPapers(papers => applyRanking(papers, event.ranking, paper => paper.paper_id))
+      }
     })
-      .then(response => {
-        if (!response.ok) throw new Error('Failed to fetch papers')
-        return response.json()
-      })
-      .then(data => setPapers(data))
       .catch(error => setError("Failed to search for papers. Please try again."))
       .finally(() => setIsPapersLoading(false))
 
-    // Search patents
-    fetch('http://localhost:8000/api/search_patents', {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        description: description,
-      }),
+    // Search patents, rendering each one as soon as it is scored
+    streamEvents<Patent>('http://localhost:8000/api/search_patents/stream', {
+      description: description,
+    }, event => {
+      if (event.event === 'patent') {
+        setPatents(patents => insertByScore(patents.filter(p => p.id !== event.patent.id), event.patent))
+      } else if (event.event === 'done') {
+        setPatents(patents => applyRanking(patents, event.ranking, patent => patent.id))
+      }
     })
-      .then(response => {
-        if (!response.ok) throw new Error('Failed to fetch patents')
-        return response.json()
-      })
-      .then(data => setPatents(data))
       .catch(error => setError("Failed to search for patents. Please try again."))
       .finally(() => setIsPatentsLoading(false))
   }